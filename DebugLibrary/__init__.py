@@ -1,11 +1,45 @@
+import os
+
+from .globals import context
 from .keywords import DebugKeywords
+from .snapshot import NON_INTERACTIVE_POLICIES
+from .steplistener import set_post_mortem
 from .version import VERSION
 
 """A debug library and REPL for RobotFramework."""
 
+POST_MORTEM = os.environ.get('RFDEBUG_POST_MORTEM', '0')
+NON_INTERACTIVE = os.environ.get('RFDEBUG_NON_INTERACTIVE', 'skip')
+
 
 class DebugLibrary(DebugKeywords):
     """Debug Library for RobotFramework."""
 
     ROBOT_LIBRARY_SCOPE = 'GLOBAL'
     ROBOT_LIBRARY_VERSION = VERSION
+
+    def __init__(self, post_mortem=POST_MORTEM,
+                 non_interactive=NON_INTERACTIVE):
+        """If `post_mortem` is greater than 0, open the interactive shell when
+        a keyword fails, at most that many times.
+
+        `non_interactive` is what to do instead of opening the shell if there
+        is no terminal, like in CI: `skip` it, save a `snapshot` of the test
+        to a JSON file in the output directory, or open the `shell` anyway.
+
+        They default to the environment variables `RFDEBUG_POST_MORTEM` and
+        `RFDEBUG_NON_INTERACTIVE`.
+        """
+        super(DebugLibrary, self).__init__()
+        non_interactive = non_interactive.lower()
+        if non_interactive not in NON_INTERACTIVE_POLICIES:
+            raise ValueError('non_interactive should be one of {0}, got {1}'
+                             .format(', '.join(NON_INTERACTIVE_POLICIES),
+                                     non_interactive))
+        context.non_interactive = non_interactive
+        try:
+            post_mortem = int(post_mortem)
+        except ValueError:
+            raise ValueError('post_mortem should be a number, got {0}'
+                             .format(post_mortem)) from None
+        set_post_mortem(post_mortem)
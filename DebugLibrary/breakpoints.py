@@ -0,0 +1,112 @@
+import os
+import re
+
+from .robotkeyword import normalize_keyword_name
+
+LINE_BREAKPOINT = re.compile(r'^(?:(?P<path>.+):)?(?P<lineno>\d+)$')
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.normpath(str(path)))
+
+
+class Breakpoint:
+    """Stop at a line of a file, or at a keyword, if condition is true."""
+
+    def __init__(self, number, path=None, lineno=None, keyword=None,
+                 condition=None):
+        self.number = number
+        self.path = normalize_path(path) if path else None
+        self.lineno = lineno
+        self.keyword = keyword
+        self.condition = condition
+        self.hits = 0
+
+    def match_source(self, source):
+        """Check if source ends with the path of breakpoint."""
+        if not self.path:
+            return True
+        source = normalize_path(source or '')
+        return (source == self.path
+                or source.endswith(os.sep + self.path.lstrip(os.sep)))
+
+    def __str__(self):
+        if self.keyword:
+            location = self.keyword
+        else:
+            location = '{0}:{1}'.format(self.path or '', self.lineno)
+        if self.condition:
+            location = '{0}  {1}'.format(location, self.condition)
+        return 'breakpoint {0} at {1}'.format(self.number, location)
+
+
+class Breakpoints:
+    """Breakpoints indexed by line number and by normalized keyword name,
+    so checking a keyword costs a couple of dict lookups."""
+
+    def __init__(self):
+        self.numbers = {}
+        self.lines = {}
+        self.keywords = {}
+        self._next_number = 1
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __iter__(self):
+        return iter(self.numbers.values())
+
+    def add(self, location, condition=None, current_path=None):
+        """Add breakpoint at `file:lineno`, `lineno` of current file or
+        keyword name."""
+        location = location.strip()
+        match = LINE_BREAKPOINT.match(location)
+        if match:
+            path = match.group('path') or current_path
+            breakpoint = Breakpoint(self._next_number, path=path,
+                                    lineno=int(match.group('lineno')),
+                                    condition=condition)
+            self.lines.setdefault(breakpoint.lineno, []).append(breakpoint)
+        else:
+            breakpoint = Breakpoint(self._next_number, keyword=location,
+                                    condition=condition)
+            key = normalize_keyword_name(location)
+            self.keywords.setdefault(key, []).append(breakpoint)
+        self.numbers[breakpoint.number] = breakpoint
+        self._next_number += 1
+        return breakpoint
+
+    def remove(self, number):
+        breakpoint = self.numbers.pop(number, None)
+        if breakpoint is None:
+            return None
+        if breakpoint.keyword:
+            index, key = self.keywords, normalize_keyword_name(
+                breakpoint.keyword)
+        else:
+            index, key = self.lines, breakpoint.lineno
+        index[key].remove(breakpoint)
+        if not index[key]:
+            del index[key]
+        return breakpoint
+
+    def clear(self):
+        self.numbers.clear()
+        self.lines.clear()
+        self.keywords.clear()
+
+    def find(self, names, lineno, get_source):
+        """Find breakpoints matching keyword names or source line.
+
+        get_source is only called if a breakpoint is set at the line.
+        """
+        found = []
+        if lineno in self.lines:
+            source = get_source()
+            found.extend(breakpoint for breakpoint in self.lines[lineno]
+                         if breakpoint.match_source(source))
+        if self.keywords:
+            for name in set(normalize_keyword_name(name)
+                            for name in names if name):
+                found.extend(self.keywords.get(name, ()))
+        return found
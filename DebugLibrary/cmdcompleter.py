@@ -1,7 +1,12 @@
+from bisect import bisect_left
+from operator import itemgetter
+
 from prompt_toolkit.completion import Completer, Completion
 
 from .robotkeyword import parse_keyword
 
+MAX_CHAR = chr(0x10ffff)
+
 
 class CmdCompleter(Completer):
     """Completer for debug shell."""
@@ -10,11 +15,47 @@ class CmdCompleter(Completer):
         self.names = []
         self.displays = {}
         self.display_metas = {}
+        # sorted (lowered name, order, name) tuples of each namespace
+        self.root_index = []
+        self.library_index = []
+        self._order = 0
+        self.add_commands(commands)
+        self.cmd_repl = cmd_repl
+
+    def add_commands(self, commands):
+        """Add (name, display, display_meta) entries to completions."""
         for name, display, display_meta in commands:
             self.names.append(name)
             self.displays[name] = display
             self.display_metas[name] = display_meta
-        self.cmd_repl = cmd_repl
+            self._get_index(name).append(
+                (name.lower().strip(), self._order, name))
+            self._order += 1
+        self.root_index.sort()
+        self.library_index.sort()
+
+    def remove_commands(self, commands):
+        """Remove entries previously added by `add_commands`."""
+        removed = {}
+        for name, _, _ in commands:
+            removed[name] = removed.get(name, 0) + 1
+
+        self.names = _remove_names(self.names, removed, lambda _: _)
+        self.root_index = _remove_names(self.root_index, removed,
+                                        itemgetter(2))
+        self.library_index = _remove_names(self.library_index, removed,
+                                           itemgetter(2))
+
+        remains = set(self.names)
+        for name in removed:
+            if name not in remains:
+                self.displays.pop(name, None)
+                self.display_metas.pop(name, None)
+
+    def _get_index(self, name):
+        if '.' in name:
+            return self.library_index
+        return self.root_index
 
     def _get_argument_completions(self, completer, document):
         """Using Cmd.py's completer to complete arguments."""
@@ -40,19 +81,25 @@ class CmdCompleter(Completer):
             yield from self._get_argument_completions(completer, document)
 
     def _get_command_completions(self, text):
+        # library level names only match if text contains a dot
+        index = self._get_index(text)
+        prefix = text.strip()
+        begin = bisect_left(index, (prefix,))
+        end = bisect_left(index, (prefix + MAX_CHAR,), begin)
+        # keep the order commands were added in
+        matched = sorted(index[begin:end], key=itemgetter(1))
         return (Completion(name,
                            -len(text),
                            display=self.displays.get(name, ''),
                            display_meta=self.display_metas.get(name, ''),
                            )
-                for name in self.names
-                if ((('.' not in name and '.' not in text)  # root level
-                     or ('.' in name and '.' in text))  # library level
-                    and name.lower().strip().startswith(text.strip()))
-                )
+                for _, _, name in matched)
 
     def get_completions(self, document, complete_event):
         """Compute suggestions."""
+        if self.cmd_repl is not None:
+            self.cmd_repl.pre_completion()
+
         text = document.text_before_cursor.lower()
         parts = parse_keyword(text)
 
@@ -61,3 +108,16 @@ class CmdCompleter(Completer):
             yield from self._get_custom_completions(cmd_name, document)
         else:
             yield from self._get_command_completions(text)
+
+
+def _remove_names(items, removed, get_name):
+    """Remove items by counts of their names, keeping the order."""
+    counts = dict(removed)
+    remains = []
+    for item in items:
+        name = get_name(item)
+        if counts.get(name):
+            counts[name] -= 1
+        else:
+            remains.append(item)
+    return remains
@@ -1,4 +1,10 @@
+import cProfile
+import io
+import json
 import os
+import pstats
+import sys
+import time
 
 from robot.api import logger
 from robot.errors import ExecutionFailed, HandlerExecutionFailed
@@ -7,27 +13,38 @@ from .cmdcompleter import CmdCompleter
 from .globals import context
 from .prompttoolkitcmd import PromptToolkitCmd
 from .robotapp import get_robot_instance, reset_robotframework_exception
-from .robotkeyword import (get_keywords, get_lib_keywords, find_keyword,
-                           run_keyword)
+from .robotkeyword import (find_keyword, get_cached_lib_keywords,
+                           get_keyword_doc, get_lib_keywords,
+                           get_lib_keywords_version, parse_keyword,
+                           pop_lib_keywords_errors, run_keyword,
+                           warm_up_lib_keywords)
 from .robotlib import get_builtin_libs, get_libs, get_libs_dict, match_libs
 from .robotselenium import SELENIUM_WEBDRIVERS, start_selenium_commands
 from .sourcelines import (RobotNeedUpgrade, print_source_lines,
                           print_test_case_lines)
-from .steplistener import is_step_mode, set_step_mode
+from .steplistener import (is_step_mode, set_step_mode, step_out,
+                           step_over, update_step_listener)
 from .styles import (DEBUG_PROMPT_STYLE, get_debug_prompt_tokens, print_error,
                      print_output)
 
 HISTORY_PATH = os.environ.get('RFDEBUG_HISTORY', '~/.rfdebug_history')
+PROFILE_TOP = 20
 
 
-def run_robot_command(robot_instance, command):
-    """Run command in robotframewrk environment."""
+def run_robot_command(robot_instance, command, profiler=None):
+    """Run command in robotframewrk environment.
+
+    The keyword runs under profiler if given, printing is not profiled.
+    """
     if not command:
         return
 
     result = ''
     try:
-        result = run_keyword(robot_instance, command)
+        if profiler:
+            result = profiler.runcall(run_keyword, robot_instance, command)
+        else:
+            result = run_keyword(robot_instance, command)
     except HandlerExecutionFailed as exc:
         print_error('! keyword:', command)
         print_error('! handler execution failed:', exc.message)
@@ -43,10 +60,25 @@ def run_robot_command(robot_instance, command):
         print_output(head, message)
 
 
+def read_script(path):
+    """Read command lines of a script file, or of stdin if path is '-'.
+
+    Empty lines and comments are skipped.
+    """
+    if path == '-':
+        content = sys.stdin.read()
+    else:
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+    return [line for line in content.splitlines()
+            if line.strip() and not line.strip().startswith('#')]
+
+
 class DebugCmd(PromptToolkitCmd):
     """Interactive debug shell for robotframework."""
 
     prompt_style = DEBUG_PROMPT_STYLE
+    show_timing = False
 
     def __init__(self, completekey='tab', stdin=None, stdout=None):
         PromptToolkitCmd.__init__(self, completekey, stdin, stdout,
@@ -78,21 +110,67 @@ Access https://github.com/xyb/robotframework-debuglibrary for more details.\
         PromptToolkitCmd.do_help(self, arg)
 
     def get_completer(self):
-        """Get completer instance specified for robotframework."""
-        # commands
-        commands = [(cmd_name, cmd_name, 'DEBUG command: {0}'.format(doc))
-                    for cmd_name, doc in self.get_helps()]
+        """Get completer instance specified for robotframework.
 
-        # libraries
-        for lib in get_libs():
-            commands.append((
-                lib.name,
-                lib.name,
-                'Library: {0} {1}'.format(lib.name, lib.version),
-            ))
+        The completer is built once and kept across shell instances, only
+        keywords of newly imported or removed libraries are updated.
+        Keywords are collected in background, and added to the completer
+        once ready.
+        """
+        if context.completer is None:
+            # commands
+            commands = [(cmd_name, cmd_name, 'DEBUG command: {0}'.format(doc))
+                        for cmd_name, doc in self.get_helps()]
+            context.completer = CmdCompleter(commands, self)
+            context.completer_libs = {}
+
+        warm_up_lib_keywords()
+        completer = context.completer
+        completer.cmd_repl = self
+        self._update_library_completions()
+        for name, exc in pop_lib_keywords_errors():
+            print_error('! keywords of library {0} not collected:'.format(
+                name), str(exc))
+        return completer
+
+    def pre_completion(self):
+        """Add keywords collected in background since last update."""
+        if context.completer_version != get_lib_keywords_version():
+            self._update_library_completions()
+
+    def _update_library_completions(self):
+        completer = context.completer
+        completer_libs = context.completer_libs
+        context.completer_version = get_lib_keywords_version()
+
+        libs = get_libs_dict()
+        for name in list(completer_libs):
+            lib, keywords, commands = completer_libs[name]
+            if (libs.get(name) is not lib
+                    or get_cached_lib_keywords(lib) is not keywords):
+                completer.remove_commands(commands)
+                del completer_libs[name]
+
+        for name, lib in sorted(libs.items()):
+            if name in completer_libs:
+                continue
+            keywords = get_cached_lib_keywords(lib)
+            if keywords is None:
+                continue  # not collected yet
+            commands = self._get_library_commands(lib, keywords)
+            completer.add_commands(commands)
+            completer_libs[name] = (lib, keywords, commands)
+
+    def _get_library_commands(self, lib, keywords):
+        # library
+        commands = [(
+            lib.name,
+            lib.name,
+            'Library: {0} {1}'.format(lib.name, lib.version),
+        )]
 
         # keywords
-        for keyword in get_keywords():
+        for keyword in keywords:
             # name with library
             name = '{0}.{1}'.format(keyword['lib'], keyword['name'])
             commands.append((
@@ -108,7 +186,7 @@ Access https://github.com/xyb/robotframework-debuglibrary for more details.\
                                             keyword['summary']),
             ))
 
-        return CmdCompleter(commands, self)
+        return commands
 
     def do_selenium(self, arg):
         """Start a selenium webdriver and open url in browser you expect.
@@ -203,20 +281,54 @@ Access https://github.com/xyb/robotframework-debuglibrary for more details.\
     def do_docs(self, keyword_name):
         """Get keyword documentation for individual keywords.
 
-         d(ocs) [<keyword_name>]
+         d(ocs) [<keyword_name> or <lib_name>.<keyword_name>]
         """
 
         keywords = find_keyword(keyword_name)
         if not keywords:
             print_error('< not find keyword', keyword_name)
         elif len(keywords) == 1:
-            logger.console(keywords[0]['doc'])
+            doc, args = get_keyword_doc(keywords[0])
+            print_output('< {0}'.format(keywords[0]['name']), args)
+            logger.console(doc)
         else:
             print_error('< found {} keywords'.format(len(keywords)),
-                        ', '.join(keywords))
+                        ', '.join('{0}.{1}'.format(_['lib'], _['name'])
+                                  for _ in keywords))
 
     do_d = do_docs
 
+    def do_timing(self, arg):
+        """Print how long every command takes, or stop printing it.
+
+        timing  [on|off]
+        """
+        arg = arg.strip().lower()
+        if arg in ('on', 'off'):
+            self.show_timing = arg == 'on'
+        elif arg:
+            print_error('! timing:', 'expect on or off, got {0}'.format(arg))
+            return
+        print_output('<', 'timing is {0}'.format(
+            'on' if self.show_timing else 'off'))
+
+    def do_profile(self, arg):
+        """Run a keyword with the python profiler and print the hot spots.
+
+        profile  <keyword>  [<args>]
+        """
+        command = arg.strip()
+        if not command:
+            print_error('! profile:', 'no keyword to profile')
+            return
+
+        profiler = cProfile.Profile()
+        run_robot_command(self.robot, command, profiler)
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream).strip_dirs()
+        stats.sort_stats('tottime').print_stats(PROFILE_TOP)
+        print(stream.getvalue().strip('\n'))
+
     def emptyline(self):
         """Repeat last nonempty command if in step mode."""
         self.repeat_last_nonempty_command = is_step_mode()
@@ -239,10 +351,39 @@ Access https://github.com/xyb/robotframework-debuglibrary for more details.\
 
     def do_next(self, args):
         """Continue execution until the next line is reached or it returns."""
-        self.do_step(args)
+        step_over()
+        self.append_exit()  # pass control back to robot runner
 
     do_n = do_next
 
+    def do_return(self, args):
+        """Continue execution until the current user keyword returns."""
+        if args.strip():
+            # keyword like `Return From Keyword`, lastcmd is the whole line
+            return self.default(self.lastcmd)
+        step_out()
+        self.append_exit()  # pass control back to robot runner
+
+    do_r = do_return
+    do_finish = do_return
+
+    def do_until(self, args):
+        """Continue execution until a line with a number greater or equal to
+        lineno is reached, or the current user keyword returns.
+
+        unt(il)  [<lineno>]
+
+        default lineno is the next line.
+        """
+        args = args.strip()
+        if args and not args.isdigit():
+            return self.default(self.lastcmd)  # a keyword
+        lineno = int(args) if args else context.current_source_lineno + 1
+        step_over(until_lineno=lineno)
+        self.append_exit()  # pass control back to robot runner
+
+    do_unt = do_until
+
     def do_continue(self, args):
         """Continue execution."""
         self.do_exit(args)
@@ -281,6 +422,79 @@ Access https://github.com/xyb/robotframework-debuglibrary for more details.\
             print('Please upgrade robotframework to support list source code:')
             print('    pip install "robotframework>=3.2" -U')
 
+    def do_break(self, args):
+        """Set a breakpoint at a line or a keyword, or list breakpoints.
+
+        b(reak)  [<file>:<lineno> | <lineno> | <keyword>]  [<condition>]
+
+        Stop only if the condition, a python expression like `Evaluate`
+        accepts, is true. The current file is used if only lineno is given.
+        """
+        breakpoints = context.breakpoints
+        if breakpoints is None:
+            print_error('! break:', 'DebugLibrary is not imported')
+            return
+        if not args.strip():
+            if not breakpoints:
+                print_output('<', 'no breakpoints')
+            for breakpoint in breakpoints:
+                print_output('<', '{0}, hit {1} times'.format(
+                    breakpoint, breakpoint.hits))
+            return
+
+        location, *condition = parse_keyword(args.strip())
+        breakpoint = breakpoints.add(
+            location, '  '.join(condition) or None,
+            current_path=context.current_source_path or None)
+        update_step_listener()
+        print_output('<', 'set {0}'.format(breakpoint))
+
+    do_b = do_break
+
+    def do_clear(self, args):
+        """Clear breakpoints by number, or all breakpoints.
+
+        clear  [<number> ...]
+        """
+        numbers = args.split()
+        if not all(number.isdigit() for number in numbers):
+            # keyword like `Clear Element Text`, lastcmd is the whole line
+            return self.default(self.lastcmd)
+        breakpoints = context.breakpoints
+        if breakpoints is None:
+            return
+        if not numbers:
+            breakpoints.clear()
+            print_output('<', 'cleared all breakpoints')
+        for number in numbers:
+            breakpoint = breakpoints.remove(int(number))
+            if breakpoint is None:
+                print_error('! clear:', 'no breakpoint {0}'.format(number))
+            else:
+                print_output('<', 'cleared {0}'.format(breakpoint))
+        update_step_listener()
+
+    def do_trace(self, args):
+        """Print keywords run in step mode and how long they took as JSON,
+        or save them to a file.
+
+        trace  [<file>]
+        """
+        records = list(context.step_trace.records if context.step_trace
+                       else [])
+        content = json.dumps(records, indent=2)
+        path = args.strip()
+        if not path:
+            print(content)
+            return
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        except OSError as exc:
+            print_error('! trace:', str(exc))
+            return
+        print_output('<', 'saved {0} steps to {1}'.format(len(records), path))
+
     def do_exit(self, args):
         """Exit debug shell."""
         set_step_mode(on=False)  # explicitly exit REPL will disable step mode
@@ -290,6 +504,10 @@ Access https://github.com/xyb/robotframework-debuglibrary for more details.\
     def onecmd(self, line):
         # restore last command acrossing different Cmd instances
         self.lastcmd = context.last_command
+        start_time = time.perf_counter()
         stop = super(DebugCmd, self).onecmd(line)
+        elapsed = time.perf_counter() - start_time
         context.last_command = self.lastcmd
+        if self.show_timing or self.script is not None:
+            print_output('#', 'took {0:.3f}s'.format(elapsed))
         return stop
@@ -1,10 +1,20 @@
 class SingletonContext:
     in_step_mode = False
-    current_runner = None
-    current_runner_step = None
+    step_over_depth = None
+    step_until_lineno = None
+    step_listener = None
+    step_trace = None
+    breakpoints = None
+    post_mortem = 0
+    non_interactive = 'skip'
+    snapshot_count = 0
     current_source_path = ''
     current_source_lineno = 0
     last_command = ''
+    completer = None
+    completer_libs = {}
+    completer_version = None
+    debug_cmd = None
 
     def __new__(cls):
         if not hasattr(cls, 'instance'):
@@ -0,0 +1,100 @@
+import datetime
+import os
+
+from prompt_toolkit.history import FileHistory
+
+HISTORY_SIZE = int(os.environ.get('RFDEBUG_HISTORY_SIZE', 1000))
+HISTORY_FILE_SIZE = 1024 * 1024
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def read_lines_reversed(path, block_size=READ_BLOCK_SIZE):
+    """Read lines of file from the end, the last line first."""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        rest = b''
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + rest).split(b'\n')
+            rest = lines.pop(0)
+            yield from reversed(lines)
+        yield rest
+
+
+def read_history_entries(path):
+    """Read entries of a FileHistory file, the most recent first."""
+    lines = []
+    for line in read_lines_reversed(path):
+        if line.startswith(b'+'):
+            lines.append(line[1:])
+        elif lines:
+            yield b'\n'.join(reversed(lines)).decode('utf-8', errors='replace')
+            lines = []
+    if lines:
+        yield b'\n'.join(reversed(lines)).decode('utf-8', errors='replace')
+
+
+class BoundedFileHistory(FileHistory):
+    """FileHistory keeping the most recent unique entries only.
+
+    The file format is the same as FileHistory. Entries are read from the
+    end of file and loading stops when enough entries are found, so a huge
+    history file does not slow down the shell. The file is compacted when it
+    grows larger than max_file_size.
+    """
+
+    def __init__(self, filename, max_entries=HISTORY_SIZE,
+                 max_file_size=HISTORY_FILE_SIZE):
+        super(BoundedFileHistory, self).__init__(filename)
+        self.max_entries = max_entries
+        self.max_file_size = max_file_size
+
+    def load_history_strings(self):
+        if not os.path.exists(self.filename):
+            return
+
+        seen = set()
+        for entry in read_history_entries(self.filename):
+            if len(seen) >= self.max_entries:
+                break
+            if entry not in seen:
+                seen.add(entry)
+                yield entry
+
+    def store_string(self, string):
+        super(BoundedFileHistory, self).store_string(string)
+        try:
+            file_size = os.path.getsize(self.filename)
+        except OSError:
+            return
+        if file_size > self.max_file_size:
+            self.compact()
+
+    def compact(self):
+        """Rewrite history file with the most recent unique entries."""
+        # keep at most half of max_file_size, so the next compaction happens
+        # only after a while
+        max_size = self.max_file_size // 2
+        entries = []
+        size = 0
+        for entry in self.load_history_strings():
+            size += len(entry.encode('utf-8')) + entry.count('\n') + 2
+            if entries and size > max_size:
+                break
+            entries.append(entry)
+
+        temp_path = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write('\n# {0}\n'.format(datetime.datetime.now())
+                        .encode('utf-8'))
+                for entry in reversed(entries):
+                    f.write(''.join('+{0}\n'.format(line)
+                                    for line in entry.split('\n'))
+                            .encode('utf-8'))
+                    f.write(b'\n')
+            os.replace(temp_path, self.filename)
+        except OSError:
+            pass  # keep the uncompacted history
@@ -1,22 +1,44 @@
 import sys
 
+from robot.api import logger
 from robot.libraries.BuiltIn import run_keyword_variant
 
-from .debugcmd import DebugCmd
+from .globals import context
 from .robotkeyword import run_debug_if
+from .snapshot import is_interactive, write_snapshot
 from .steplistener import RobotLibraryStepListenerMixin, is_step_mode
-from .styles import print_output
 from .webdriver import get_remote_url, get_session_id, get_webdriver_remote
 
 
 class DebugKeywords(RobotLibraryStepListenerMixin):
     """Debug Keywords for RobotFramework."""
 
-    def debug(self):
+    def debug(self, script=None):
         """Open a interactive shell, run any RobotFramework keywords.
 
         Keywords separated by two space or one tab, and Ctrl-D to exit.
+
+        If `script` is given, run the keywords and commands of that file in
+        batch instead, or of stdin if it is `-`, and report how long each of
+        them took.
+
+        Without a terminal, like in CI, the shell is not opened but skipped,
+        or a snapshot of the test is saved, see `non_interactive` argument
+        of the library.
         """
+        # a running script continues at the next step without a terminal
+        debug_cmd = context.debug_cmd
+        running_script = debug_cmd is not None and debug_cmd.script is not None
+        if script is None and not running_script and not is_interactive():
+            if self._skip_shell():
+                return
+
+        # import prompt-toolkit and others only when a shell is opened
+        from .debugcmd import DebugCmd, read_script
+        from .styles import print_output
+
+        lines = read_script(script) if script else None
+
         # re-wire stdout so that we can use the cmd module and have readline
         # support
         old_stdout = sys.stdout
@@ -26,11 +48,23 @@ class DebugKeywords(RobotLibraryStepListenerMixin):
         if show_intro:
             print_output('\n>>>>>', 'Enter interactive shell')
 
-        self.debug_cmd = DebugCmd()
-        if show_intro:
-            self.debug_cmd.cmdloop()
-        else:
-            self.debug_cmd.cmdloop(intro='')
+        # reuse the shell and its prompt session between breakpoints and
+        # steps, so re-entering the prompt costs nothing
+        if context.debug_cmd is None:
+            context.debug_cmd = DebugCmd()
+        self.debug_cmd = context.debug_cmd
+        if lines is not None:
+            self.debug_cmd.set_script(lines)
+        listener = context.step_listener
+        suspended = listener.suspended
+        listener.suspended = True
+        try:
+            if show_intro and self.debug_cmd.script is None:
+                self.debug_cmd.cmdloop()
+            else:
+                self.debug_cmd.cmdloop(intro='')
+        finally:
+            listener.suspended = suspended
 
         show_intro = not is_step_mode()
         if show_intro:
@@ -39,6 +73,22 @@ class DebugKeywords(RobotLibraryStepListenerMixin):
         # put stdout back where it was
         sys.stdout = old_stdout
 
+    def _skip_shell(self):
+        policy = context.non_interactive
+        if policy == 'snapshot':
+            # the test continues even if the snapshot can not be saved
+            try:
+                path = write_snapshot()
+            except Exception as exc:
+                logger.warn('No terminal to open debug shell, failed to save '
+                            'snapshot: {0}'.format(exc))
+            else:
+                logger.warn('No terminal to open debug shell, saved snapshot '
+                            'to {0}'.format(path))
+        elif policy == 'skip':
+            logger.warn('No terminal to open debug shell, skipped')
+        return policy != 'shell'
+
     @run_keyword_variant(resolve=1)
     def debug_if(self, condition, *args):
         """Runs the Debug keyword if condition is true."""
@@ -1,15 +1,107 @@
 import cmd
 import os
 
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.shortcuts import CompleteStyle, prompt
+from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
+from prompt_toolkit.shortcuts import CompleteStyle, PromptSession
+
+from .history import BoundedFileHistory
+
+# suggest the most frequent command from history instead of the most recent
+SUGGEST_BY_FREQUENCY = os.environ.get('RFDEBUG_SUGGEST', 'recent') == 'frequent'
+
+
+class IndexedAutoSuggestFromHistory(AutoSuggest):
+    """Give suggestions based on the lines in the history, using an index.
+
+    Lines are indexed by their prefixes as the history grows, so a
+    suggestion is a dict lookup instead of scanning the whole history on
+    every key press. Only lines added since the last key press are indexed.
+    The most recent line wins, or the most frequent one if rank_by_frequency
+    is set.
+    """
+
+    prefix_size = 32
+
+    def __init__(self, rank_by_frequency=False):
+        self.rank_by_frequency = rank_by_frequency
+        self._reset(None)
+
+    def _reset(self, history):
+        self._history = history
+        self._strings_count = 0
+        self._last_string = None
+        self._order = 0
+        self._scores = {}  # line -> score, the higher the better
+        self._best_lines = {}  # short prefix -> best line
+        self._long_lines = {}  # prefix of prefix_size -> longer lines
+
+    def _add_line(self, line):
+        self._order += 1
+        if self.rank_by_frequency:
+            count = self._scores[line][0] if line in self._scores else 0
+            score = (count + 1, self._order)
+        else:
+            score = self._order
+        self._scores[line] = score
+
+        for end in range(1, min(len(line), self.prefix_size) + 1):
+            prefix = line[:end]
+            best_line = self._best_lines.get(prefix)
+            if best_line is None or self._scores[best_line] <= score:
+                self._best_lines[prefix] = line
+        if len(line) > self.prefix_size:
+            self._long_lines.setdefault(
+                line[:self.prefix_size], set()).add(line)
+
+    def _update_index(self, history):
+        # most recent first; get_strings() copies the whole history on every
+        # key press, so read the loaded strings directly if possible
+        strings = getattr(history, '_loaded_strings', None)
+        if strings is None:
+            strings = history.get_strings()[::-1]
+        count = self._strings_count
+        new_count = len(strings) - count
+        if (history is not self._history or new_count < 0
+                or (count and strings[new_count] is not self._last_string)):
+            # history has been reloaded, rebuild the index
+            self._reset(history)
+            new_count = len(strings)
+
+        for string in reversed(strings[:new_count]):
+            for line in string.splitlines():
+                self._add_line(line)
+        self._strings_count = len(strings)
+        self._last_string = strings[0] if strings else None
+
+    def find_line(self, text):
+        """Find the best history line starting with text."""
+        line = self._best_lines.get(text[:self.prefix_size])
+        if line is None or line.startswith(text):
+            return line
+        lines = [line for line in
+                 self._long_lines.get(text[:self.prefix_size], ())
+                 if line.startswith(text)]
+        return max(lines, key=self._scores.get, default=None)
+
+    def get_suggestion(self, buffer, document):
+        self._update_index(buffer.history)
+
+        # Consider only the last line for the suggestion.
+        text = document.text.rsplit('\n', 1)[-1]
+
+        # Only create a suggestion when this is not an empty line.
+        if text.strip():
+            line = self.find_line(text)
+            if line is not None:
+                return Suggestion(line[len(text):])
+        return None
 
 
 class BaseCmd(cmd.Cmd):
     """Basic REPL tool."""
     prompt = '> '
     repeat_last_nonempty_command = False
+    script = None
 
     def emptyline(self):
         """Do not repeat the last command if input empty unless forced to."""
@@ -59,9 +151,29 @@ class BaseCmd(cmd.Cmd):
     def pre_loop_iter(self):
         """Excute before every loop iteration."""
 
+    def pre_completion(self):
+        """Excute before computing completions."""
+
+    def set_script(self, lines):
+        """Run command lines in batch instead of prompting for input.
+
+        The shell exits when the lines run out.
+        """
+        self.script = iter(lines)
+
+    def get_script_input(self):
+        line = next(self.script, None)
+        if line is None:
+            self.script = None
+            return 'EOF'
+        print(self.prompt + line)
+        return line
+
     def _get_input(self):
         if self.cmdqueue:
             return self.cmdqueue.pop(0)
+        elif self.script is not None:
+            return self.get_script_input()
         else:
             try:
                 return self.get_input()
@@ -91,10 +203,10 @@ class BaseCmd(cmd.Cmd):
 
         override default cmdloop method
         """
-        if intro is not None:
-            self.intro = intro
-        if self.intro:
-            self.stdout.write(self.intro)
+        if intro is None:
+            intro = self.intro
+        if intro:
+            self.stdout.write(intro)
             self.stdout.write('\n')
 
         self.preloop()
@@ -122,23 +234,33 @@ Type "help" for more information.\
     def __init__(self, completekey='tab', stdin=None, stdout=None,
                  history_path=''):
         BaseCmd.__init__(self, completekey, stdin, stdout)
-        self.history = FileHistory(os.path.expanduser(history_path))
+        self.history = BoundedFileHistory(os.path.expanduser(history_path))
+        self.session = None
+
+    def get_prompt_session(self):
+        """Get prompt session, created once and reused by every prompt."""
+        if self.session is None:
+            kwargs = dict(
+                history=self.history,
+                auto_suggest=IndexedAutoSuggestFromHistory(
+                    rank_by_frequency=SUGGEST_BY_FREQUENCY),
+                enable_history_search=True,
+                complete_style=CompleteStyle.MULTI_COLUMN,
+            )
+            if self.get_prompt_tokens:
+                kwargs['style'] = self.prompt_style
+            self.session = PromptSession(**kwargs)
+        return self.session
 
     def get_input(self):
-        kwargs = dict(
-            history=self.history,
-            auto_suggest=AutoSuggestFromHistory(),
-            enable_history_search=True,
-            completer=self.get_completer(),
-            complete_style=CompleteStyle.MULTI_COLUMN,
-        )
+        session = self.get_prompt_session()
         if self.get_prompt_tokens:
-            kwargs['style'] = self.prompt_style
             prompt_str = self.get_prompt_tokens(self.prompt)
         else:
             prompt_str = self.prompt
         try:
-            line = prompt(message=prompt_str, **kwargs)
+            line = session.prompt(message=prompt_str,
+                                  completer=self.get_completer())
         except EOFError:
             line = 'EOF'
         return line
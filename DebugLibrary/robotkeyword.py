@@ -1,8 +1,18 @@
+import hashlib
+import json
+import os
 import re
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 from robot.libraries.BuiltIn import BuiltIn
+from robot.utils import normalize
 
-from .robotlib import ImportedLibraryDocBuilder, get_libs
+from .robotlib import (build_keyword_doc, find_lib_handler, get_lib_handlers,
+                       get_lib_key, get_lib_real_name, get_libs,
+                       get_libs_dict)
 from .robotvar import assign_variable
 
 try:
@@ -12,7 +22,27 @@ except ImportError:
 
 KEYWORD_SEP = re.compile('  +|\t')
 
-_lib_keywords_cache = {}
+LIB_KEYWORDS_CACHE_SIZE = 128
+# keywords of libraries are kept on disk across runs, disabled if empty
+KEYWORDS_CACHE_DIR = os.environ.get('RFDEBUG_CACHE', '~/.rfdebug_cache')
+# keywords of these libraries are not decided by the library source
+NOT_CACHED_ON_DISK_LIBS = ['Remote']
+
+# library identity -> keywords, least recently used first
+_lib_keywords_cache = OrderedDict()
+_lib_keywords_lock = threading.RLock()
+# changed whenever keywords of a library are added to cache
+_lib_keywords_version = 0
+_warm_up_thread = None
+# library identity -> error of collecting keywords in background, not
+# collected again until the library is imported again
+_failed_lib_keys = {}
+# (library name, error) not reported to user yet
+_unreported_lib_errors = []
+# normalized keyword name, with and without library name -> keywords
+_keywords_index = {}
+# keywords of libraries in the index, as got by get_lib_keywords
+_indexed_lib_keywords = []
 
 
 def parse_keyword(command):
@@ -22,36 +52,215 @@ def parse_keyword(command):
 
 
 def get_lib_keywords(library):
-    """Get keywords of imported library."""
-    if library.name in _lib_keywords_cache:
-        return _lib_keywords_cache[library.name]
-
-    lib = ImportedLibraryDocBuilder().build(library)
-    keywords = []
-    for keyword in lib.keywords:
-        keywords.append({
-            'name': keyword.name,
-            'lib': library.name,
-            'doc': keyword.doc,
-            'summary': keyword.doc.split('\n')[0],
-        })
-
-    _lib_keywords_cache[library.name] = keywords
+    """Get keywords of imported library.
+
+    Only names and summaries are collected, use `get_keyword_doc` to get the
+    full documentation of a keyword.
+    """
+    global _lib_keywords_version
+
+    key = get_lib_key(library)
+    keywords = _get_cached_keywords(key)
+    if keywords is not None:
+        return keywords
+
+    keywords = _load_keywords_file(key, library)
+    if keywords is None:
+        keywords = []
+        for handler in get_lib_handlers(library):
+            keywords.append({
+                'name': handler.name,
+                'lib': library.name,
+                'summary': (handler.doc or '').split('\n')[0],
+            })
+        _save_keywords_file(key, library, keywords)
+
+    with _lib_keywords_lock:
+        # may be collected by warm up thread in the meantime
+        cached = _get_cached_keywords(key)
+        if cached is not None:
+            return cached
+        _lib_keywords_cache[key] = keywords
+        while len(_lib_keywords_cache) > LIB_KEYWORDS_CACHE_SIZE:
+            _lib_keywords_cache.popitem(last=False)
+        _lib_keywords_version += 1
     return keywords
 
 
-def get_keywords():
-    """Get all keywords of libraries."""
-    for lib in get_libs():
-        yield from get_lib_keywords(lib)
+def _get_cached_keywords(key):
+    with _lib_keywords_lock:
+        if key in _lib_keywords_cache:
+            _lib_keywords_cache.move_to_end(key)
+            return _lib_keywords_cache[key]
+    return None
+
+
+def _get_keywords_file(key, library):
+    name, args, source, mtime, version = key
+    if (not KEYWORDS_CACHE_DIR or mtime is None
+            or get_lib_real_name(library) in NOT_CACHED_ON_DISK_LIBS):
+        return None
+    digest = hashlib.sha1(repr((name, args)).encode('utf-8')).hexdigest()
+    filename = '{0}-{1}.json'.format(re.sub(r'[^\w.-]', '_', name), digest)
+    return os.path.join(os.path.expanduser(KEYWORDS_CACHE_DIR), filename)
+
+
+def _load_keywords_file(key, library):
+    """Load keywords of library from disk, None if not saved or outdated."""
+    path = _get_keywords_file(key, library)
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('key') != repr(key):
+        return None
+    return data['keywords']
+
+
+def _save_keywords_file(key, library, keywords):
+    """Save keywords of library to disk, replacing the outdated ones."""
+    path = _get_keywords_file(key, library)
+    if not path:
+        return
+    temp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # saved by warm up thread and foreground at the same time sometimes
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                         dir=os.path.dirname(path))
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump({'key': repr(key), 'keywords': keywords}, f)
+        os.replace(temp_path, path)
+    except OSError:
+        # caching on disk is optional
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def get_cached_lib_keywords(library):
+    """Get keywords of imported library if collected already, else None."""
+    return _get_cached_keywords(get_lib_key(library))
+
+
+def get_lib_keywords_version():
+    """Get a number which changes whenever keywords of a library are
+    collected."""
+    return _lib_keywords_version
+
+
+def warm_up_lib_keywords(libs=None):
+    """Collect keywords of not cached libraries in a background thread.
+
+    Does nothing if the previous warm up thread is still running.
+    """
+    global _warm_up_thread
+
+    if _warm_up_thread and _warm_up_thread.is_alive():
+        return
+    libs = [lib for lib in (libs or get_libs())
+            if get_cached_lib_keywords(lib) is None
+            and get_lib_key(lib) not in _failed_lib_keys]
+    if not libs:
+        return
+
+    _warm_up_thread = threading.Thread(target=_collect_lib_keywords,
+                                       args=(libs,),
+                                       name='DebugLibraryWarmUp',
+                                       daemon=True)
+    _warm_up_thread.start()
+
+
+def _collect_lib_keywords(libs):
+    global _lib_keywords_version
+
+    for lib in libs:
+        try:
+            get_lib_keywords(lib)
+        except Exception as exc:
+            with _lib_keywords_lock:
+                _failed_lib_keys[get_lib_key(lib)] = exc
+                _unreported_lib_errors.append((lib.name, exc))
+                _lib_keywords_version += 1
+
+
+def pop_lib_keywords_errors():
+    """Get errors of collecting keywords in background not reported yet."""
+    with _lib_keywords_lock:
+        errors = list(_unreported_lib_errors)
+        del _unreported_lib_errors[:]
+    return errors
+
+
+def get_keyword_doc(keyword):
+    """Get full documentation and arguments of keyword, built on demand."""
+    if 'doc' not in keyword:
+        library = get_libs_dict().get(keyword['lib'])
+        handler = library and find_lib_handler(library, keyword['name'])
+        if not handler:
+            return keyword['summary'], ''
+        keyword_doc = build_keyword_doc(handler)
+        keyword['doc'] = keyword_doc.doc
+        keyword['args'] = '  '.join(str(arg) for arg in keyword_doc.args)
+    return keyword['doc'], keyword['args']
+
+
+def invalidate_lib_keywords(library=None):
+    """Drop cached keywords of library, or of all libraries if not given."""
+    global _lib_keywords_version
+
+    with _lib_keywords_lock:
+        if library is None:
+            _lib_keywords_cache.clear()
+            _failed_lib_keys.clear()
+        else:
+            key = get_lib_key(library)
+            _lib_keywords_cache.pop(key, None)
+            _failed_lib_keys.pop(key, None)
+        _lib_keywords_version += 1
+    _keywords_index.clear()
+    _indexed_lib_keywords.clear()
+
+
+@lru_cache(maxsize=1024)
+def normalize_keyword_name(name):
+    """Normalize keyword name like RF does: ignore case, spaces and
+    underscores."""
+    return normalize(name, ignore='_')
+
+
+def _index_lib_keywords(keywords):
+    for keyword in keywords:
+        full_name = '{0}.{1}'.format(keyword['lib'], keyword['name'])
+        for name in (keyword['name'], full_name):
+            key = normalize_keyword_name(name)
+            _keywords_index.setdefault(key, []).append(keyword)
+    _indexed_lib_keywords.append(keywords)
+
+
+def get_keywords_index():
+    """Get keywords of imported libraries indexed by normalized name."""
+    # keywords are collected again when a library is removed or changed,
+    # like reloaded with a new version
+    lib_keywords = [get_lib_keywords(lib) for lib in get_libs()]
+    current = {id(keywords) for keywords in lib_keywords}
+    if any(id(keywords) not in current
+           for keywords in _indexed_lib_keywords):
+        _keywords_index.clear()
+        _indexed_lib_keywords.clear()
+    indexed = {id(keywords) for keywords in _indexed_lib_keywords}
+    for keywords in lib_keywords:
+        if id(keywords) not in indexed:
+            _index_lib_keywords(keywords)
+    return _keywords_index
 
 
 def find_keyword(keyword_name):
-    keyword_name = keyword_name.lower()
-    return [keyword
-            for lib in get_libs()
-            for keyword in get_lib_keywords(lib)
-            if keyword['name'].lower() == keyword_name]
+    """Find keywords by name, optionally prefixed with library name."""
+    key = normalize_keyword_name(keyword_name)
+    return get_keywords_index().get(key, [])
 
 
 def _execute_variable(robot_instance, variable_name, keyword, args):
@@ -1,5 +1,5 @@
-from robot.libdocpkg.model import LibraryDoc
-from robot.libdocpkg.robotbuilder import KeywordDocBuilder, LibraryDocBuilder
+import os
+
 from robot.libraries import STDLIBS
 from robot.running.namespace import IMPORTER
 
@@ -9,9 +9,16 @@ def get_builtin_libs():
     return list(STDLIBS)
 
 
+_libs_cache = {'imported': [], 'sorted': []}
+
+
 def get_libs():
-    """Get imported robotframework library names."""
-    return sorted(IMPORTER._library_cache._items, key=lambda _: _.name)
+    """Get imported robotframework libraries, sorted by name."""
+    imported = IMPORTER._library_cache._items
+    if imported != _libs_cache['imported']:
+        _libs_cache['imported'] = list(imported)
+        _libs_cache['sorted'] = sorted(imported, key=lambda _: _.name)
+    return _libs_cache['sorted']
 
 
 def get_libs_dict():
@@ -19,6 +26,28 @@ def get_libs_dict():
     return {lib.name: lib for lib in IMPORTER._library_cache._items}
 
 
+def get_lib_key(lib):
+    """Get identity of imported library: name, args, source and version."""
+    cache = IMPORTER._library_cache
+    args = ''
+    for key, item in zip(cache._keys, cache._items):
+        if item is lib:
+            # key is (name, positional args, named args)
+            args = repr(key[1:])
+            break
+
+    source = str(lib.source) if lib.source else ''
+    mtime = os.path.getmtime(source) if os.path.exists(source) else None
+    return (lib.name, args, source, mtime, lib.version)
+
+
+def get_lib_real_name(lib):
+    """Get name of library, not the alias given when importing."""
+    # orig_name in robotframework < 7.0
+    return (getattr(lib, 'real_name', None) or getattr(lib, 'orig_name', None)
+            or lib.name)
+
+
 def match_libs(name=''):
     """Find libraries by prefix of library name, default all"""
     libs = [_.name for _ in get_libs()]
@@ -26,14 +55,24 @@ def match_libs(name=''):
     return matched
 
 
-class ImportedLibraryDocBuilder(LibraryDocBuilder):
+def get_lib_handlers(lib):
+    """Get keyword handlers of imported library."""
+    if hasattr(lib, 'handlers'):  # robotframework < 7.0
+        return list(lib.handlers)
+    return lib.keywords
+
+
+def find_lib_handler(lib, name):
+    """Find keyword handler of imported library by keyword name."""
+    for handler in get_lib_handlers(lib):
+        if handler.name == name:
+            return handler
+    return None
+
+
+def build_keyword_doc(handler):
+    """Build libdoc of keyword handler, with full documentation and
+    arguments."""
+    from robot.libdocpkg.robotbuilder import KeywordDocBuilder
 
-    def build(self, lib):
-        libdoc = LibraryDoc(
-            name=lib.name,
-            doc=self._get_doc(lib),
-            doc_format=lib.doc_format,
-        )
-        libdoc.inits = self._get_initializers(lib)
-        libdoc.keywords = KeywordDocBuilder().build_keywords(lib)
-        return libdoc
+    return KeywordDocBuilder().build_keyword(handler)
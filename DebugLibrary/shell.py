@@ -3,34 +3,78 @@ import sys
 import tempfile
 
 from robot import run_cli
+from robot.api import TestSuite
+from robot.utils import escape
 
-TEST_SUITE = b'''*** Settings ***
+TEST_SUITE = '''*** Settings ***
 Library  DebugLibrary
 
 ** test cases **
 RFDEBUG REPL
-    debug
+    debug{0}
 '''
 
 
 def shell():
-    """A standalone robotframework shell."""
+    """A standalone robotframework shell.
 
-    default_no_logs = '-l None -x None -o None -L None -r None'
+    Usage: rfdebug [--script <file>|-] [robot arguments]
+    """
 
+    args, script = pop_script_option(sys.argv[1:])
+    if args:
+        sys.exit(run_suite_file(args, script))
+    sys.exit(run_suite_in_memory(script))
+
+
+def pop_script_option(args):
+    """Split the `--script <file>` option from robot arguments."""
+    args = list(args)
+    script = None
+    for index, arg in enumerate(args):
+        if arg == '--script' and index + 1 < len(args):
+            script = args[index + 1]
+            del args[index:index + 2]
+            break
+        if arg.startswith('--script='):
+            script = arg[len('--script='):]
+            del args[index]
+            break
+    return args, script
+
+
+def get_debug_args(script):
+    """Get arguments of the debug keyword."""
+    if not script:
+        return []
+    return ['script={0}'.format(escape(script))]
+
+
+def run_suite_in_memory(script=None):
+    """Run the shell in an in-memory test suite, without any output files.
+
+    Much faster than parsing a suite file through the whole robot pipeline.
+    """
+    suite = TestSuite(name='RFDEBUG')
+    suite.resource.imports.library('DebugLibrary')
+    test = suite.tests.create(name='RFDEBUG REPL')
+    test.body.create_keyword(name='debug', args=get_debug_args(script))
+
+    result = suite.run(output=None, log=None, report=None)
+    return result.return_code
+
+
+def run_suite_file(args, script=None):
+    """Run the shell in a temporary test suite file with robot arguments."""
     with tempfile.NamedTemporaryFile(prefix='robot-debug-',
                                      suffix='.robot',
                                      delete=False) as test_file:
-        test_file.write(TEST_SUITE)
+        debug_args = ''.join('    ' + arg for arg in get_debug_args(script))
+        test_file.write(TEST_SUITE.format(debug_args).encode('utf-8'))
         test_file.flush()
 
-        if len(sys.argv) > 1:
-            args = sys.argv[1:] + [test_file.name]
-        else:
-            args = default_no_logs.split() + [test_file.name]
-
         try:
-            sys.exit(run_cli(args))
+            return run_cli(args + [test_file.name], exit=False)
         finally:
             test_file.close()
             # pybot will raise PermissionError on Windows NT or later
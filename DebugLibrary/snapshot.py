@@ -0,0 +1,69 @@
+import datetime
+import json
+import os
+import sys
+
+from robot.running.context import EXECUTION_CONTEXTS
+
+from .globals import context
+from .robotapp import get_robot_instance
+
+NON_INTERACTIVE_POLICIES = ('skip', 'snapshot', 'shell')
+SNAPSHOT_TRACE_SIZE = 100
+
+
+def is_interactive():
+    """Check if there's a terminal to read commands from."""
+    stdin = sys.__stdin__
+    return stdin is not None and stdin.isatty()
+
+
+def get_running_keyword():
+    """Get the innermost running keyword, robotframework >= 6.0 only."""
+    steps = getattr(EXECUTION_CONTEXTS.current, 'steps', None)
+    if not steps:
+        return None
+    step = steps[-1]
+    # robotframework >= 7.0 keeps running and result models
+    return step[0] if isinstance(step, tuple) else step
+
+
+def get_location():
+    """Get source and line number of the keyword stopped at, or of the
+    running Debug keyword."""
+    listener = context.step_listener
+    if listener and listener.running:
+        return context.current_source_path, context.current_source_lineno
+    keyword = get_running_keyword()
+    return (str(getattr(keyword, 'source', None) or ''),
+            getattr(keyword, 'lineno', None))
+
+
+def take_snapshot():
+    """Get current test, location, variables and recent step trace."""
+    robot = get_robot_instance()
+    source, lineno = get_location()
+    variables = robot.get_variables()
+    records = list(context.step_trace.records if context.step_trace else [])
+    return {
+        'time': datetime.datetime.now().isoformat(),
+        'suite': robot.get_variable_value('${SUITE NAME}'),
+        'test': robot.get_variable_value('${TEST NAME}'),
+        'source': source or None,
+        'lineno': lineno or None,
+        'variables': {name: repr(variables[name]) for name in variables},
+        'trace': records[-SNAPSHOT_TRACE_SIZE:],
+    }
+
+
+def write_snapshot():
+    """Write snapshot to a new file in the output directory of robot, and
+    return the path of file."""
+    snapshot = take_snapshot()
+    output_dir = get_robot_instance().get_variable_value('${OUTPUT DIR}')
+    context.snapshot_count += 1
+    path = os.path.join(output_dir or os.curdir, 'rfdebug-snapshot-{0}.json'
+                        .format(context.snapshot_count))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=2)
+    return path
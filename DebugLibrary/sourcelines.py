@@ -1,6 +1,15 @@
+import io
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+
+from robot.api.parsing import ModelVisitor, get_model
 from robot.version import get_version
 
 ROBOT_VERION_RUNNER_GET_STEP_LINENO = '3.2'
+SOURCE_CACHE_SIZE = 32
+
+_source_cache = OrderedDict()
 
 
 class RobotNeedUpgrade(Exception):
@@ -12,14 +21,98 @@ def check_version():
         raise RobotNeedUpgrade
 
 
+class SourceFile:
+    """Lines of a source file read at a specific version of the file."""
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        with open(path, encoding='utf-8') as f:
+            self.lines = f.readlines()
+        self._blocks = None
+        self._block_starts = None
+
+    def find_block(self, lineno):
+        """Find (first, last) lineno of test case or keyword has lineno.
+
+        Return None if lineno is not inside any block.
+        """
+        if self._blocks is None:
+            self._blocks = _get_blocks(self.lines)
+            self._block_starts = [start for start, _ in self._blocks]
+
+        index = bisect_right(self._block_starts, lineno) - 1
+        if index >= 0:
+            start, end = self._blocks[index]
+            if lineno <= end:
+                return start, end
+        return None
+
+
+class BlockFinder(ModelVisitor):
+    """Collect line ranges of test cases and keywords."""
+
+    def __init__(self):
+        self.blocks = []
+
+    def visit_TestCase(self, node):
+        self.blocks.append((node.lineno, node.end_lineno))
+
+    visit_Keyword = visit_TestCase
+
+
+def _get_blocks(lines):
+    """Get sorted line ranges of test cases and keywords."""
+    finder = BlockFinder()
+    finder.visit(get_model(io.StringIO(''.join(lines))))
+
+    blocks = []
+    for start, end in finder.blocks:
+        # trailing empty lines are not part of the block
+        while end > start and not lines[end - 1].strip():
+            end -= 1
+        blocks.append((start, end))
+    return sorted(blocks)
+
+
+def get_source_file(path):
+    """Get source file from cache, re-read it if modified since cached.
+
+    Least recently used files are evicted when cache is full.
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    source = _source_cache.get(path)
+    if source is None or source.version != version:
+        source = SourceFile(path, version)
+        _source_cache[path] = source
+        while len(_source_cache) > SOURCE_CACHE_SIZE:
+            _source_cache.popitem(last=False)
+    _source_cache.move_to_end(path)
+    return source
+
+
+def get_source_lines(path):
+    """Get all lines of source file."""
+    return get_source_file(path).lines
+
+
+def get_source_line(path, lineno):
+    """Get the line of source file by 1-based lineno, empty if not exists."""
+    lines = get_source_lines(path)
+    if 0 < lineno <= len(lines):
+        return lines[lineno - 1]
+    return ''
+
+
 def print_source_lines(source_file, lineno, before_and_after=5):
     check_version()
 
     if not source_file or not lineno:
         return
 
-    with open(source_file) as f:
-        lines = f.readlines()
+    lines = get_source_lines(source_file)
 
     start_index = max(1, lineno - before_and_after - 1)
     end_index = min(len(lines) + 1, lineno + before_and_after)
@@ -32,13 +125,18 @@ def print_test_case_lines(source_file, current_lineno):
     if not source_file or not current_lineno:
         return
 
-    with open(source_file) as f:
-        lines = f.readlines()
-
-    # find the first line of current test case
-    start_index = _find_first_lineno(lines, current_lineno)
-    # find the last line of current test case
-    end_index = _find_last_lineno(lines, current_lineno)
+    source = get_source_file(source_file)
+    lines = source.lines
+
+    block = source.find_block(current_lineno)
+    if block:
+        first_lineno, last_lineno = block
+        start_index, end_index = first_lineno - 1, last_lineno
+    else:
+        # find the first line of current test case
+        start_index = _find_first_lineno(lines, current_lineno)
+        # find the last line of current test case
+        end_index = _find_last_lineno(lines, current_lineno)
 
     _print_lines(lines, start_index, end_index, current_lineno)
 
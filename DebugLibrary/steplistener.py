@@ -1,73 +1,463 @@
-import inspect
+import time
+from collections import deque
 
+from robot.output import LOGGER
+from robot.running.context import EXECUTION_CONTEXTS
+
+from .breakpoints import Breakpoints
 from .globals import context
+from .robotapp import get_robot_instance
+from .sourcelines import get_source_line
+
+try:
+    from robot.output.loggerapi import LoggerApi
+except ImportError:  # robotframework < 7.0
+    LoggerApi = object
 
 
 class RobotLibraryStepListenerMixin:
-    ROBOT_LISTENER_API_VERSION = 2
+    """Stop at every keyword in step mode, at breakpoints, or at failed
+    keywords in post-mortem mode.
+
+    Keyword events are only received while in step mode, breakpoints are
+    set or post-mortem mode is on, see `StepListener`.
+    """
 
     def __init__(self):
         super(RobotLibraryStepListenerMixin, self).__init__()
-        self.ROBOT_LIBRARY_LISTENER = [self]
-
-    def _start_keyword(self, name, attrs):
-        context.current_source_path = ''
-        context.current_source_lineno = 0
+        context.step_listener = StepListener(self)
+        context.step_trace = StepTrace()
+        context.breakpoints = Breakpoints()
 
-        if not is_step_mode():
+    def _start_keyword(self, data, result, breakpoint=None, depth=None):
+        if not is_step_mode() and breakpoint is None:
             return
 
-        find_runner_step()
-        step = context.current_runner_step
+        if breakpoint is not None:
+            print('# hit {}'.format(breakpoint))
+
+        trace = context.step_trace
+        for record in trace.pop_unreported():
+            print('<- {}  took {:.3f}s, {:.3f}s in test since stepping'
+                  .format(record['keyword'], record['elapsed'],
+                          record['test_elapsed']))
+
+        translated = self._print_keyword(data, result)
+
+        # callback debug interface
+        start_time = time.perf_counter()
+        self.debug()
+        trace.add_pause(time.perf_counter() - start_time)
+
+        if is_step_mode():
+            trace.start_keyword(translated, context.current_source_lineno,
+                                context.current_source_path, depth)
+
+    def _end_keyword(self, data, result, depth=None):
+        context.step_trace.end_keyword(depth)
+
+    def _post_mortem(self, data, result, message):
+        context.post_mortem -= 1
+        print('# post-mortem: {}'.format(message))
+        self._print_keyword(data, result)
+        self.debug()
 
-        path = ''
-        if hasattr(step, 'lineno'):
-            path = step.source
-            lineno = step.lineno
-        elif 'lineno' in attrs:
-            path = attrs['source']
-            lineno = attrs['lineno']
+    def _print_keyword(self, data, result):
+        """Print source location and line of keyword, and return the keyword
+        line with full keyword name."""
+        context.current_source_path = ''
+        context.current_source_lineno = 0
 
-        if path:
-            lineno_0_based = lineno - 1
+        path = str(getattr(data, 'source', None) or '')
+        lineno = getattr(data, 'lineno', None)
+        if path and lineno:
             context.current_source_path = path
             context.current_source_lineno = lineno
             print('> {}({})'.format(path, lineno))
-            line = (open(path).readlines()[lineno_0_based].strip())
+            line = get_source_line(path, lineno).strip()
             print('-> {}'.format(line))
 
-        if attrs['assign']:
-            assign = '%s = ' % ', '.join(attrs['assign'])
-        else:
-            assign = ''
-            name = '{}.{}'.format(attrs['libname'], attrs['kwname'])
-
-        translated = '{}{}  {}'.format(assign, name, '  '.join(attrs['args']))
+        translated = get_keyword_line(result)
         print('=> {}'.format(translated))
+        return translated
 
-        # callback debug interface
-        self.debug()
 
-    start_keyword = _start_keyword
+STEP_TRACE_SIZE = 10000
+
 
+class StepTrace:
+    """Time keywords run in step mode.
 
-# Hack to find the current runner Step to get the source path and line number.
-# This method relies on the internal implementation logic of RF and may need
-# to be modified when there are major changes to RF.
-def find_runner_step():
-    stack = inspect.stack()
-    for frame in stack:
-        if (frame.function == 'run_steps'  # RobotFramework < 4.0
-                or frame.function == 'run'):  # RobotFramework >= 4.0
-            arginfo = inspect.getargvalues(frame.frame)
-            context.current_runner = arginfo.locals.get('runner')
-            context.current_runner_step = arginfo.locals.get('step')
-            if context.current_runner_step:
-                break
+    Time spent in the debug shell is not counted. Ended keywords are kept as
+    records, the latest STEP_TRACE_SIZE ones only.
+    """
+
+    def __init__(self):
+        self.records = deque(maxlen=STEP_TRACE_SIZE)
+        self.test = None
+        self.test_elapsed = 0.0
+        # (record, start time, pause time at start, depth of keyword)
+        self._started = []
+        self._pause = 0.0
+        self._unreported = []
+
+    def start_test(self, name):
+        self.test = name
+        self.test_elapsed = 0.0
+        self._started = []
+
+    def clear_started(self):
+        self._started = []
+
+    def add_pause(self, seconds):
+        self._pause += seconds
+
+    def start_keyword(self, keyword, lineno, source, depth=None):
+        record = {
+            'test': self.test,
+            'keyword': keyword,
+            'source': str(source) if source else None,
+            'lineno': lineno or None,
+            'depth': len(self._started),
+        }
+        self._started.append((record, time.perf_counter(), self._pause,
+                              depth))
+
+    def end_keyword(self, depth=None):
+        # keywords stepped over after started, like by return, never end
+        while (depth is not None and self._started
+               and self._started[-1][3] is not None
+               and self._started[-1][3] > depth):
+            self._started.pop()
+        # keywords started before stepping, or stepped over, are not traced
+        if not self._started or self._started[-1][3] != depth:
+            return
+        record, start_time, pause, _ = self._started.pop()
+        record['elapsed'] = (time.perf_counter() - start_time
+                             - (self._pause - pause))
+        if not self._started:
+            self.test_elapsed += record['elapsed']
+        record['test_elapsed'] = self.test_elapsed
+        self.records.append(record)
+        self._unreported.append(record)
+
+    def pop_unreported(self):
+        """Get ended keywords not reported yet, outermost only."""
+        records, self._unreported = self._unreported, []
+        if not records:
+            return []
+        depth = min(record['depth'] for record in records)
+        return [record for record in records if record['depth'] == depth]
+
+
+class StepListener(LoggerApi):
+    """Pass keyword events of robot to the library.
+
+    It is registered as a logger of robot only while in step mode,
+    breakpoints are set or post-mortem mode is on, so there's no overhead for
+    running keywords otherwise. Source, line number and arguments are read
+    from the running and result model objects robot passes in, instead of
+    walking the stack.
+
+    Depth of keywords is counted from the keyword running when attached, so
+    keywords deeper than `context.step_over_depth`, or before
+    `context.step_until_lineno` at that depth, are run without stopping.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        # keywords run in debug shell should not be stepped into
+        self.running = False
+        # keywords typed in the shell of Debug keyword are not stopped at
+        self.suspended = False
+        self.depth = 0
+        self.stopped_depth = None
+        # depth of the last failed keyword, its callers fail after it
+        self.failed_depth = None
+        # depth of the running keyword catching failures of keywords it runs
+        self.catching_depth = None
+        # the first failure in TRY, reported if no EXCEPT matches it, when
+        # TRY/EXCEPT of caught_depth ends
+        self.caught_failure = None
+        self.caught_depth = None
+        self.failure_message = ''
+
+    def attach(self):
+        if self not in _get_loggers():
+            LOGGER.register_logger(self)
+            self.depth = 0
+            self.failed_depth = None
+            self.catching_depth = None
+            self.caught_failure = None
+            self.caught_depth = None
+            # events of keywords started before are missed, and the test is
+            # not started yet if the library is imported outside of robot,
+            # like by libdoc
+            name = None
+            if EXECUTION_CONTEXTS.current is not None:
+                name = get_robot_instance().get_variable_value(
+                    '${TEST NAME}')
+            context.step_trace.start_test(name)
+
+    def detach(self):
+        LOGGER.unregister_logger(self)
+
+    def start_keyword(self, data, result=None):
+        if result is None:  # robotframework < 7.0
+            # data and result are combined, attributes are looked up from
+            # result first, then from data
+            result = data
+        self.start_body_item(data, result)
+
+    def start_test(self, data, result=None):
+        context.step_trace.start_test(data.name)
+
+    def end_keyword(self, data, result=None):
+        if result is None:  # robotframework < 7.0
+            result = data
+        self.end_body_item(data, result)
+
+    def end_body_item(self, data, result):
+        if self.running or self.suspended:
+            return
+        self.depth -= 1
+        if is_step_mode() and not is_stepped_over(self.depth):
+            self.library._end_keyword(data, result, self.depth)
+        if context.post_mortem > 0:
+            failure = self.find_uncaught_failure(data, result)
+            if failure is not None:
+                self.running = True
+                try:
+                    self.library._post_mortem(*failure)
+                finally:
+                    self.running = False
+
+    def log_message(self, message):
+        # failure of keyword is logged before it ends
+        if message.level == 'FAIL':
+            self.failure_message = message.message
+
+    def get_failure(self, data, result):
+        # robotframework < 7.0 has no message in keyword result
+        message = getattr(result, 'message', None) or self.failure_message
+        return data, result, message
+
+    def find_uncaught_failure(self, data, result):
+        """Get data, result and message of the ended keyword if it failed by
+        itself, not because a keyword it runs failed, and the failure is not
+        caught by TRY/EXCEPT or keywords like `Run Keyword And Ignore Error`.
+        """
+        failed = getattr(result, 'status', None) == 'FAIL'
+        if self.catching_depth is not None:
+            if self.depth > self.catching_depth:
+                if failed and self.caught_failure is None:
+                    self.caught_failure = self.get_failure(data, result)
+                return None
+            self.catching_depth = None
+            if not _is_keyword(result):
+                # TRY fails if EXCEPT is run, the failure in it is reported
+                # when TRY/EXCEPT ends, if no EXCEPT matches
+                if failed:
+                    self.caught_depth = self.depth - 1
+                else:
+                    self.caught_failure = None
+                return None
+            self.caught_failure = None
+
+        failure = self.get_failure(data, result)
+        if self.caught_depth == self.depth:  # end of TRY/EXCEPT
+            failure = self.caught_failure or failure
+            self.caught_failure = self.caught_depth = None
+
+        failed_depth = self.failed_depth
+        if not failed:
+            if failed_depth is not None and self.depth < failed_depth:
+                self.failed_depth = None  # failure was caught
+            return None
+        self.failed_depth = self.depth
+        if failed_depth is None or self.depth >= failed_depth:
+            return failure
+        return None
+
+    def start_body_item(self, data, result):
+        if self.running or self.suspended:
+            return
+        depth = self.depth
+        self.depth += 1
+        if (context.post_mortem > 0 and self.catching_depth is None
+                and is_catching(data, result)):
+            self.catching_depth = depth
+        breakpoint = None
+        if not should_stop_at(depth, getattr(data, 'lineno', None)):
+            breakpoint = find_breakpoint(data, result)
+            if breakpoint is None:
+                return
+        self.running = True
+        self.stopped_depth = depth
+        try:
+            self.library._start_keyword(data, result, breakpoint, depth)
+        finally:
+            self.running = False
+
+    def get_current_depth(self):
+        """Get depth of the keyword stopped at, or of the running Debug
+        keyword if not stopped."""
+        if self.running:
+            return self.stopped_depth
+        return self.depth - 1
+
+
+def find_breakpoint(data, result):
+    """Find the first breakpoint set at keyword whose condition is true."""
+    names = ()
+    if _is_keyword(result):
+        names = (getattr(result, 'full_name', None),
+                 getattr(result, 'name', None),
+                 getattr(result, 'kwname', None))  # robotframework < 7.0
+    breakpoints = context.breakpoints.find(
+        names, getattr(data, 'lineno', None),
+        lambda: getattr(data, 'source', None))
+    for breakpoint in breakpoints:
+        if _check_condition(breakpoint):
+            breakpoint.hits += 1
+            return breakpoint
+    return None
+
+
+CATCHING_KEYWORDS = {
+    'BuiltIn.Run Keyword And Expect Error',
+    'BuiltIn.Run Keyword And Ignore Error',
+    'BuiltIn.Run Keyword And Return Status',
+    'BuiltIn.Run Keyword And Warn On Failure',
+    'BuiltIn.Wait Until Keyword Succeeds',
+}
+
+
+def is_catching(data, result):
+    """Check if failures of keywords run by keyword, or by TRY, are caught by
+    it."""
+    if not _is_keyword(result):
+        if result.type != 'TRY':
+            return False
+        # robotframework < 7.0 passes data combined with result
+        data = getattr(data, 'data', data)
+        # TRY/FINALLY without EXCEPT catches nothing
+        return bool(getattr(data.parent, 'except_branches', None))
+    return _get_keyword_name(result) in CATCHING_KEYWORDS
+
+
+def _check_condition(breakpoint):
+    if not breakpoint.condition:
+        return True
+    try:
+        robot = get_robot_instance()
+        condition = robot.replace_variables(breakpoint.condition)
+        return bool(robot.evaluate(condition))
+    except Exception as exc:
+        print('! {} condition failed: {}'.format(breakpoint, exc))
+        return True
+
+
+def _get_loggers():
+    # robotframework < 7.0 wraps loggers by proxies
+    return [getattr(logger, 'logger', logger)
+            for logger in LOGGER._other_loggers]
+
+
+KEYWORD_TYPES = ('KEYWORD', 'SETUP', 'TEARDOWN')
+
+
+def _is_keyword(result):
+    return getattr(result, 'type', 'KEYWORD') in KEYWORD_TYPES
+
+
+def _get_control_name(result):
+    """Get name of control structure, like FOR and IF."""
+    # `name` of control structures is deprecated since robotframework 7.0,
+    # and `_log_name` of TRY and its branches is empty
+    if hasattr(result, '_log_name'):
+        return result._log_name or result.type
+    return getattr(result, 'name', None) or result.type
+
+
+def _get_keyword_name(result):
+    """Get keyword name with library name."""
+    if not _is_keyword(result):
+        return _get_control_name(result)
+    return (getattr(result, 'full_name', None)
+            or getattr(result, 'name', None) or '')
+
+
+def get_keyword_line(result):
+    """Get keyword line with full keyword name, like `${a} =  BuiltIn.Log  a`.
+    """
+    if not _is_keyword(result):
+        return _get_control_name(result)
+    assign = '{} = '.format(', '.join(result.assign)) if result.assign else ''
+    args = [arg if isinstance(arg, str) else str(arg) for arg in result.args]
+    return '{}{}  {}'.format(assign, _get_keyword_name(result),
+                             '  '.join(args))
+
+
+def should_stop_at(depth, lineno):
+    """Check if stepping stops at keyword, only integers are compared."""
+    if not is_step_mode() or is_stepped_over(depth):
+        return False
+    until_lineno = context.step_until_lineno
+    return (until_lineno is None or depth < context.step_over_depth
+            or (lineno or 0) >= until_lineno)
+
+
+def is_stepped_over(depth):
+    over_depth = context.step_over_depth
+    return over_depth is not None and depth > over_depth
 
 
 def set_step_mode(on=True):
     context.in_step_mode = on
+    context.step_over_depth = None
+    context.step_until_lineno = None
+    if not on and context.step_trace:
+        # end events are not received until stepping again
+        context.step_trace.clear_started()
+    update_step_listener()
+
+
+def step_over(until_lineno=None):
+    """Step mode, but stop only at keywords not deeper than the current.
+
+    If until_lineno is given, keywords of the same level before the line are
+    not stopped at either, until the current user keyword returns.
+    """
+    set_step_mode(on=True)
+    if context.step_listener:
+        context.step_over_depth = context.step_listener.get_current_depth()
+        context.step_until_lineno = until_lineno
+
+
+def step_out():
+    """Step mode, but stop only after the current user keyword returns."""
+    set_step_mode(on=True)
+    if context.step_listener:
+        context.step_over_depth = (
+            context.step_listener.get_current_depth() - 1)
+
+
+def set_post_mortem(times):
+    """Open debug shell when keywords fail, at most the given times."""
+    context.post_mortem = times
+    update_step_listener()
+
+
+def update_step_listener():
+    """Receive keyword events only when stepping, breakpoints are set or in
+    post-mortem mode."""
+    if context.step_listener:
+        if (is_step_mode() or context.breakpoints
+                or context.post_mortem > 0):
+            context.step_listener.attach()
+        else:
+            context.step_listener.detach()
 
 
 def is_step_mode():
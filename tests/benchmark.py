@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""Micro-benchmarks of DebugLibrary.
+
+Usage: python tests/benchmark.py [<benchmark name> ...]
+"""
+
+import os
+import subprocess
+import sys
+import time
+import timeit
+from unittest import mock
+
+import pexpect
+from prompt_toolkit.document import Document
+from robot.api import TestSuite
+from robot.running import TestLibrary
+
+from DebugLibrary import robotkeyword
+from DebugLibrary.cmdcompleter import CmdCompleter
+from DebugLibrary.robotkeyword import get_lib_keywords, invalidate_lib_keywords
+
+REPEAT = 5
+
+
+def report(name, seconds, number):
+    print('{:<44} {:>10.3f} ms'.format(name, seconds / number * 1000))
+
+
+def best_of(func, number):
+    return min(timeit.repeat(func, number=number, repeat=REPEAT))
+
+
+def benchmark_completer(keywords_count=50000, libs_count=100):
+    """Completion latency against a synthetic keyword set."""
+    commands = []
+    for index in range(keywords_count):
+        lib = 'Library{}'.format(index % libs_count)
+        name = 'Keyword {} Of {}'.format(index, lib)
+        commands.append(('{}.{}'.format(lib, name), name, 'Keyword'))
+        commands.append((name, name, 'Keyword[{}.]'.format(lib)))
+
+    number = 1
+    seconds = best_of(lambda: CmdCompleter(commands), number)
+    report('build {} keywords'.format(keywords_count), seconds, number)
+
+    completer = CmdCompleter(commands)
+    for text in ['k', 'keyword 4', 'keyword 4999', 'library7.keyword 7',
+                 'nothing']:
+        def complete():
+            return list(completer.get_completions(Document(text), None))
+
+        number = 10
+        seconds = best_of(complete, number)
+        report('complete {!r} ({} matches)'.format(text, len(complete())),
+               seconds, number)
+
+
+def import_library(name):
+    if hasattr(TestLibrary, 'from_name'):  # robotframework >= 7.0
+        return TestLibrary.from_name(name)
+    return TestLibrary(name)
+
+
+def benchmark_lib_keywords(names=('BuiltIn', 'Collections', 'DateTime',
+                                  'OperatingSystem', 'Process', 'String',
+                                  'XML')):
+    """Collecting keywords of standard libraries."""
+    libs = [import_library(name) for name in names]
+
+    def get_keywords():
+        invalidate_lib_keywords()
+        for lib in libs:
+            get_lib_keywords(lib)
+
+    number = 1
+    # time collecting, not loading from disk cache
+    with mock.patch.object(robotkeyword, 'KEYWORDS_CACHE_DIR', ''):
+        seconds = best_of(get_keywords, number)
+    report('keywords of {} libraries'.format(len(libs)), seconds, number)
+
+
+def benchmark_suite(keywords_count=20000):
+    """Running a suite with DebugLibrary imported or not."""
+    for imported in [False, True]:
+        suite = TestSuite(name='Benchmark')
+        if imported:
+            suite.resource.imports.library('DebugLibrary')
+        test = suite.tests.create(name='Test')
+        for _ in range(keywords_count):
+            test.body.create_keyword(name='No Operation')
+
+        def run():
+            suite.run(output=None, console='none')
+
+        number = 1
+        seconds = best_of(run, number)
+        report('{} keywords, DebugLibrary {}'.format(
+            keywords_count, 'imported' if imported else 'not imported'),
+            seconds, number)
+
+
+def benchmark_debug_cmd(number=20):
+    """Preparing the shell and prompt session for a breakpoint or step."""
+    from DebugLibrary.debugcmd import DebugCmd
+
+    def create():
+        DebugCmd().get_prompt_session()
+
+    debug_cmd = DebugCmd()
+    debug_cmd.get_prompt_session()
+
+    def reuse():
+        debug_cmd.get_prompt_session()
+
+    report('new shell per step', best_of(create, number), number)
+    report('reused shell', best_of(reuse, number), number)
+
+
+def benchmark_history(entries_count=500000):
+    """Loading history from a huge history file."""
+    import tempfile
+
+    from prompt_toolkit.history import FileHistory
+
+    from DebugLibrary.history import BoundedFileHistory
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, 'history')
+        with open(path, 'w') as f:
+            for i in range(entries_count):
+                f.write('\n# 2024-01-01 00:00:00\n+log  {0}\n'.format(i))
+        name = '{0}MB history'.format(os.path.getsize(path) // 1024 // 1024)
+
+        number = 3
+        for history_class in [FileHistory, BoundedFileHistory]:
+            seconds = best_of(
+                lambda: list(history_class(path).load_history_strings()),
+                number)
+            report('{0}, {1}'.format(name, history_class.__name__),
+                   seconds, number)
+
+
+def benchmark_auto_suggest(entries_count=10000):
+    """Suggesting from history on a key press."""
+    from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+    from prompt_toolkit.buffer import Buffer
+    from prompt_toolkit.history import InMemoryHistory
+
+    from DebugLibrary.prompttoolkitcmd import IndexedAutoSuggestFromHistory
+
+    history = InMemoryHistory()
+    for i in range(entries_count):
+        history.append_string('log to console  message {0}'.format(i))
+    buffer = Buffer(history=history)
+
+    number = 100
+    for auto_suggest in [AutoSuggestFromHistory(),
+                         IndexedAutoSuggestFromHistory()]:
+        auto_suggest.get_suggestion(buffer, Document('warm up'))
+        for text in ['log', 'log to console  message 1', 'get time']:
+            seconds = best_of(
+                lambda: auto_suggest.get_suggestion(buffer, Document(text)),
+                number)
+            report('{0} entries, {1!r}, {2}'.format(
+                entries_count, text, type(auto_suggest).__name__),
+                seconds, number)
+
+
+def benchmark_breakpoints(breakpoints_count=100):
+    """Checking breakpoints at the start of a keyword."""
+    from robot import result, running
+
+    from DebugLibrary.breakpoints import Breakpoints
+    from DebugLibrary.globals import context
+    from DebugLibrary.steplistener import find_breakpoint
+
+    breakpoints = Breakpoints()
+    for i in range(breakpoints_count):
+        breakpoints.add('tests/step.robot:{0}'.format(1000 + i))
+        breakpoints.add('Keyword {0}'.format(i))
+    context.breakpoints = breakpoints
+
+    suite = running.TestSuite(source='tests/step.robot')
+    data = suite.tests.create().body.create_keyword('Log', args=['hello'])
+    data.lineno = 10
+    if hasattr(data, 'to_dict'):  # robotframework >= 7.0
+        keyword = result.Keyword(name='Log', owner='BuiltIn', args=['hello'])
+    else:
+        data, keyword = None, result.Keyword(kwname='Log', libname='BuiltIn',
+                                             args=['hello'])
+
+    number = 100000
+    seconds = best_of(lambda: find_breakpoint(data, keyword), number)
+    report('{0} breakpoints, keyword not hit'.format(len(breakpoints)),
+           seconds, number)
+
+
+IMPORT_TIME_CODE = '''
+import time
+# imported already when robot imports the library
+import robot.running, robot.libraries.BuiltIn
+start = time.perf_counter()
+import DebugLibrary
+print(time.perf_counter() - start)
+'''
+
+
+def benchmark_import(times=10):
+    """Time of importing DebugLibrary in a robot process."""
+    seconds = []
+    for _ in range(times):
+        output = subprocess.check_output([sys.executable, '-c',
+                                          IMPORT_TIME_CODE])
+        seconds.append(float(output))
+    report('import DebugLibrary', min(seconds), 1)
+
+
+def benchmark_shell_startup(times=5):
+    """Time from starting rfdebug to the first prompt."""
+    no_logs = '-l None -x None -o None -L None -r None'.split()
+    for name, args in [('in-memory suite', []), ('suite file', no_logs)]:
+        seconds = []
+        for _ in range(times):
+            start = time.perf_counter()
+            child = pexpect.spawn(sys.executable,
+                                  ['-m', 'DebugLibrary.shell'] + args)
+            child.expect('> ', timeout=30)
+            seconds.append(time.perf_counter() - start)
+            child.sendline('exit')
+            child.expect(pexpect.EOF, timeout=30)
+        report('start shell with {}'.format(name), min(seconds), 1)
+
+
+BENCHMARKS = {
+    'auto_suggest': benchmark_auto_suggest,
+    'breakpoints': benchmark_breakpoints,
+    'completer': benchmark_completer,
+    'debug_cmd': benchmark_debug_cmd,
+    'history': benchmark_history,
+    'import': benchmark_import,
+    'lib_keywords': benchmark_lib_keywords,
+    'shell_startup': benchmark_shell_startup,
+    'suite': benchmark_suite,
+}
+
+
+def main(names):
+    for name in names or BENCHMARKS:
+        print('== {}: {}'.format(name, BENCHMARKS[name].__doc__))
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,10 +1,32 @@
 #!/usr/bin/env python
 
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 
 import pexpect
+from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.document import Document
+from prompt_toolkit.history import InMemoryHistory
+from robot import running
 from robot.version import get_version
 
+from DebugLibrary import DebugLibrary, robotkeyword, sourcelines
+from DebugLibrary.breakpoints import Breakpoints
+from DebugLibrary.cmdcompleter import CmdCompleter
+from DebugLibrary.debugcmd import DebugCmd
+from DebugLibrary.globals import context
+from DebugLibrary.history import BoundedFileHistory
+from DebugLibrary.keywords import DebugKeywords
+from DebugLibrary.prompttoolkitcmd import IndexedAutoSuggestFromHistory
+from DebugLibrary.steplistener import (StepListener, StepTrace, set_step_mode,
+                                       step_out, step_over)
+
 TIMEOUT_SECONDS = 2
 
 child = None
@@ -61,6 +83,12 @@ def base_functional_testing():
     # auto suggest
     check_prompt('g', 'et time')
 
+    # timing and profile
+    check_command('timing on', 'timing is on')
+    check_command('log  hello', 'took [0-9.]+s')
+    check_command('timing off', 'timing is off')
+    check_command('profile  log  hello', 'function calls.*Ordered by')
+
     # help
     check_command('libs',
                   'Imported libraries:.*DebugLibrary.*Builtin libraries:')
@@ -71,6 +99,12 @@ def base_functional_testing():
     check_command('k debuglibrary', 'Debug')
     check_command('k nothing', 'not found library')
     check_command('d Debug', 'Open a interactive shell,')
+    check_command('d builtin.log_to console',
+                  'Log To Console .*message.*Logs the given message')
+
+    # completions of libraries imported in shell
+    check_command('import library  String', '> ')
+    check_prompt('convert to low\t', 'Convert To Lower Case')
 
     # var
     check_command('@{{list}} =  Create List    hello    world',
@@ -121,6 +155,7 @@ def step_functional_testing():
         check_command('l',  # list
                       '  7 ->	    log to console  working')
         check_command('n',  # next
+                      '<- BuiltIn.Log To Console  working  took .*s.*'
                       '/tests/step.robot.8..*'
                       '@.* =  Create List    hello    world.*'
                       '@.* = BuiltIn.Create List  hello  world')
@@ -135,11 +170,25 @@ def step_functional_testing():
                       '  9.*'
                       ' 10   	test2.*'
                       ' 11 ->	    log to console  another test case.*'
-                      ' 12   	    log to console  end')
+                      ' 12   	    log twice  nested')
         check_command('ll',  # longlist
                       ' 10   	test2.*'
                       ' 11 ->	    log to console  another test case.*'
-                      ' 12   	    log to console  end')
+                      ' 12   	    log twice  nested.*'
+                      ' 13   	    log to console  end')
+        check_command('trace',
+                      '"keyword": "BuiltIn.Log To Console  working".*'
+                      '"lineno": 7.*"elapsed": ')
+        check_command('n',
+                      'another test case.*'
+                      '/tests/step.robot.12..*'
+                      '=> .*log twice  nested')
+        # keywords in user keyword are not stopped at
+        check_command('n',
+                      'nested.*nested.*'
+                      '<- .*log twice  nested  took .*'
+                      '/tests/step.robot.13..*'
+                      '=> BuiltIn.Log To Console  end')
     else:
         check_command('s',  # step
                       '=> BuiltIn.Log To Console  working')
@@ -153,7 +202,6 @@ def step_functional_testing():
     # Exit the debug mode started by Debug keyword.
     check_command('c',  # continue
                   'Exit shell.*'
-                  'another test case.*'
                   'end')
     # Exit the interactive shell started by "DebugLibrary/shell.py".
     check_command('c', 'Report: ')
@@ -162,6 +210,737 @@ def step_functional_testing():
     return 'OK'
 
 
+def breakpoint_functional_testing():
+    global child
+    child = pexpect.spawn('coverage',
+                          ['run', '--append', 'DebugLibrary/shell.py',
+                           'tests/step.robot'])
+    child.expect('Type "help" for more information.*>',
+                 timeout=TIMEOUT_SECONDS * 3)
+
+    check_command('b  step.robot:8', 'set breakpoint 1 at step.robot:8')
+    check_command("break  log to console  '${TEST NAME}' == 'test2'",
+                  'set breakpoint 2 at log to console')
+    check_command('c',
+                  'working.*'
+                  '# hit breakpoint 1 at step.robot:8.*'
+                  '/tests/step.robot.8..*'
+                  '@.* = BuiltIn.Create List  hello  world')
+    check_command('b',
+                  'breakpoint 1 at step.robot:8, hit 1 times.*'
+                  'breakpoint 2 at log to console  .*, hit 0 times')
+    check_command('c',
+                  '# hit breakpoint 2 at log to console.*'
+                  '/tests/step.robot.11.')
+    check_command('clear', 'cleared all breakpoints')
+    check_command('b  18', 'set breakpoint 3 at .*step.robot:18')
+    check_command('c',
+                  'another test case.*'
+                  '# hit breakpoint 3 at .*step.robot:18.*'
+                  '/tests/step.robot.18.')
+    check_command('until  19',
+                  'nested.*'
+                  '/tests/step.robot.19..*'
+                  '=> BuiltIn.Log To Console')
+    check_command('return',
+                  'nested.*'
+                  '/tests/step.robot.13..*'
+                  '=> BuiltIn.Log To Console  end')
+    check_command('c', 'end')
+    check_command('c', 'Report: ')
+    child.wait()
+
+    return 'OK'
+
+
+def script_functional_testing():
+    global child
+    with tempfile.NamedTemporaryFile('w', suffix='.txt',
+                                     delete=False) as script:
+        script.write('log to console  hello\n'
+                     '\n'
+                     '# comment\n'
+                     '${secs} =  Get Time  epoch\n'
+                     'nothing\n')
+    try:
+        child = pexpect.spawn('coverage',
+                              ['run', '--append', 'DebugLibrary/shell.py',
+                               '--script', script.name])
+        # output may be read at once, don't match into the next commands
+        check_result('> log to console  hello.*?hello.*?took [0-9.]+s')
+        check_result('> \\${secs} =  Get Time  epoch.*?secs.*? = '
+                     '.*?took [0-9.]+s')
+        check_result("> nothing.*?No keyword with name 'nothing' found"
+                     '.*?took [0-9.]+s')
+        check_result('Exit shell.')
+        child.wait()
+    finally:
+        os.unlink(script.name)
+
+    return 'OK'
+
+
+def post_mortem_functional_testing():
+    global child
+    with tempfile.NamedTemporaryFile('w', suffix='.robot',
+                                     delete=False) as suite_file:
+        suite_file.write('*** Settings ***\n'
+                         'Library  DebugLibrary\n'
+                         '\n'
+                         '*** Test Cases ***\n'
+                         'test\n'
+                         '    Run Keyword And Ignore Error  Fail  ignored\n'
+                         '    Check  42\n'
+                         '\n'
+                         '*** Keywords ***\n'
+                         'Check\n'
+                         '    [Arguments]  ${value}\n'
+                         '    Should Be Equal  ${value}  43\n')
+    try:
+        child = pexpect.spawn('coverage',
+                              ['run', '--append', 'DebugLibrary/shell.py',
+                               suite_file.name],
+                              env=dict(os.environ, RFDEBUG_POST_MORTEM='1'))
+        child.expect('# post-mortem: 42 != 43.*'
+                     '.robot.12..*'
+                     '-> Should Be Equal  \\${value}  43.*'
+                     '=> BuiltIn.Should Be Equal.*>',
+                     timeout=TIMEOUT_SECONDS * 3)
+        check_command('${value}', '42')
+        check_command('c', 'Enter interactive shell')
+        check_command('c', 'Report: ')
+        child.wait()
+    finally:
+        os.unlink(suite_file.name)
+
+    return 'OK'
+
+
+class CmdCompleterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.completer = CmdCompleter([
+            ('keywords', 'keywords', 'DEBUG command'),
+            ('Get Time', 'Get Time', 'Keyword[BuiltIn.]'),
+            ('BuiltIn.Get Time', 'Get Time', 'Keyword'),
+            ('Get Count', 'Get Count', 'Keyword[BuiltIn.]'),
+            ('Keyword Should Exist', 'Keyword Should Exist', 'Keyword'),
+        ])
+
+    def complete(self, text):
+        completions = self.completer.get_completions(Document(text), None)
+        return [_.text for _ in completions]
+
+    def test_complete_root_level(self):
+        self.assertEqual(self.complete('k'),
+                         ['keywords', 'Keyword Should Exist'])
+        self.assertEqual(self.complete('GET '), ['Get Time', 'Get Count'])
+        self.assertEqual(self.complete('nothing'), [])
+
+    def test_complete_library_level(self):
+        self.assertEqual(self.complete('builtin.'), ['BuiltIn.Get Time'])
+        self.assertEqual(self.complete('builtin.get c'), [])
+
+    def test_add_and_remove_commands(self):
+        commands = [('Get Time', 'Get Time', 'Keyword[DateTime.]'),
+                    ('DateTime.Get Time', 'Get Time', 'Keyword')]
+        self.completer.add_commands(commands)
+        self.assertEqual(self.complete('get t'), ['Get Time', 'Get Time'])
+        self.assertEqual(self.complete('datetime.'), ['DateTime.Get Time'])
+
+        self.completer.remove_commands(commands)
+        self.assertEqual(self.complete('get t'), ['Get Time'])
+        self.assertEqual(self.complete('datetime.'), [])
+
+
+class SourceCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = self.write('test.robot', 'line1\nline2\n')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tempdir.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_get_source_line(self):
+        self.assertEqual(sourcelines.get_source_line(self.path, 2), 'line2\n')
+        self.assertEqual(sourcelines.get_source_line(self.path, 0), '')
+        self.assertEqual(sourcelines.get_source_line(self.path, 3), '')
+
+    def test_reload_modified_file(self):
+        source = sourcelines.get_source_file(self.path)
+        self.assertIs(sourcelines.get_source_file(self.path), source)
+
+        self.write('test.robot', 'line1\nline2 changed\nline3\n')
+        self.assertEqual(sourcelines.get_source_line(self.path, 2),
+                         'line2 changed\n')
+
+    def test_find_block(self):
+        path = self.write('blocks.robot', '''\
+*** Test Cases ***
+test1
+    log  1
+
+    log  2
+# comment
+test2
+    kw
+
+*** Keywords ***
+kw
+    log  3
+''')
+        source = sourcelines.get_source_file(path)
+        self.assertIsNone(source.find_block(1))
+        self.assertEqual(source.find_block(4), (2, 6))
+        self.assertEqual(source.find_block(5), (2, 6))
+        self.assertEqual(source.find_block(8), (7, 8))
+        self.assertIsNone(source.find_block(9))
+        self.assertEqual(source.find_block(12), (11, 12))
+
+    def test_evict_least_recently_used(self):
+        size = sourcelines.SOURCE_CACHE_SIZE
+        sourcelines.get_source_file(self.path)
+        for index in range(size):
+            path = self.write('{}.robot'.format(index), '')
+            sourcelines.get_source_file(path)
+        self.assertNotIn(self.path, sourcelines._source_cache)
+        self.assertEqual(len(sourcelines._source_cache), size)
+
+
+class KeywordsCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(robotkeyword, 'KEYWORDS_CACHE_DIR',
+                                    self.tempdir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        if hasattr(running.TestLibrary, 'from_name'):  # robotframework >= 7
+            self.lib = running.TestLibrary.from_name('String')
+        else:
+            self.lib = running.TestLibrary('String')
+        robotkeyword.invalidate_lib_keywords()
+
+    def tearDown(self):
+        robotkeyword.invalidate_lib_keywords()
+        self.tempdir.cleanup()
+
+    def test_load_keywords_from_disk(self):
+        keywords = robotkeyword.get_lib_keywords(self.lib)
+        self.assertIn('Convert To Lower Case', [_['name'] for _ in keywords])
+        self.assertEqual(len(os.listdir(self.tempdir.name)), 1)
+
+        robotkeyword.invalidate_lib_keywords()
+        with mock.patch.object(robotkeyword, 'get_lib_handlers',
+                               side_effect=AssertionError):
+            self.assertEqual(robotkeyword.get_lib_keywords(self.lib),
+                             keywords)
+
+    def test_outdated_keywords_on_disk(self):
+        robotkeyword.get_lib_keywords(self.lib)
+        robotkeyword.invalidate_lib_keywords()
+
+        name, args, source, mtime, version = robotkeyword.get_lib_key(
+            self.lib)
+        key = (name, args, source, mtime + 1, version)
+        with mock.patch.object(robotkeyword, 'get_lib_key',
+                               return_value=key):
+            with mock.patch.object(robotkeyword, 'get_lib_handlers',
+                                   return_value=[]):
+                self.assertEqual(robotkeyword.get_lib_keywords(self.lib), [])
+
+    @mock.patch.object(robotkeyword, 'get_libs')
+    def test_find_keyword_of_changed_library(self, get_libs):
+        get_libs.return_value = [self.lib]
+        self.assertEqual(
+            len(robotkeyword.find_keyword('string.convert_to_lower case')), 1)
+
+        name, args, source, mtime, version = robotkeyword.get_lib_key(
+            self.lib)
+        key = (name, args, source, mtime, '2.0')
+        handler = mock.Mock(doc='New.')
+        handler.name = 'New Keyword'
+        with mock.patch.object(robotkeyword, 'get_lib_key',
+                               return_value=key), \
+                mock.patch.object(robotkeyword, 'get_lib_handlers',
+                                  return_value=[handler]):
+            self.assertEqual(
+                robotkeyword.find_keyword('string.convert_to_lower case'), [])
+            self.assertEqual(len(robotkeyword.find_keyword('new keyword')), 1)
+
+    def test_remote_not_cached_on_disk(self):
+        # name of library imported with alias
+        real_name = ('real_name' if hasattr(self.lib, 'real_name')
+                     else 'orig_name')
+        with mock.patch.object(self.lib, real_name, 'Remote'):
+            robotkeyword.get_lib_keywords(self.lib)
+        self.assertEqual(os.listdir(self.tempdir.name), [])
+
+    def test_warm_up_error(self):
+        with mock.patch.object(robotkeyword, 'get_lib_handlers',
+                               side_effect=RuntimeError('broken')):
+            robotkeyword._collect_lib_keywords([self.lib])
+        errors = robotkeyword.pop_lib_keywords_errors()
+        self.assertEqual([(name, str(exc)) for name, exc in errors],
+                         [('String', 'broken')])
+        self.assertEqual(robotkeyword.pop_lib_keywords_errors(), [])
+
+        # not collected again in background
+        with mock.patch('threading.Thread') as thread:
+            robotkeyword.warm_up_lib_keywords([self.lib])
+        self.assertFalse(thread.called)
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'history')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_load_recent_unique_entries(self):
+        history = BoundedFileHistory(self.path, max_entries=3)
+        for command in ['log  1', 'log  2', 'log  1', 'for\n  log  3',
+                        'log  4']:
+            history.store_string(command)
+
+        history = BoundedFileHistory(self.path, max_entries=3)
+        self.assertEqual(list(history.load_history_strings()),
+                         ['log  4', 'for\n  log  3', 'log  1'])
+
+    def test_compact(self):
+        history = BoundedFileHistory(self.path, max_file_size=1000)
+        for i in range(100):
+            history.store_string('log  {0}'.format(i))
+
+        self.assertLessEqual(os.path.getsize(self.path), 1000)
+        entries = list(BoundedFileHistory(self.path).load_history_strings())
+        self.assertEqual(entries[0], 'log  99')
+        self.assertEqual(entries, ['log  {0}'.format(i)
+                                   for i in range(99, 99 - len(entries), -1)])
+
+
+class AutoSuggestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.history = InMemoryHistory()
+        self.buffer = Buffer(history=self.history)
+
+    def get_suggestion(self, auto_suggest, text):
+        suggestion = auto_suggest.get_suggestion(self.buffer, Document(text))
+        return suggestion and suggestion.text
+
+    def test_same_as_auto_suggest_from_history(self):
+        lines = ['log  hello', 'log to console  hi', 'get time',
+                 'log  hello world', 'FOR  ${i}  IN RANGE  10\n  log  ${i}',
+                 'log to console  a very long message here',
+                 'log to console  a very long text here']
+        indexed = IndexedAutoSuggestFromHistory()
+        linear = AutoSuggestFromHistory()
+        texts = ['l', 'log', 'log  h', 'log to console  a very l',
+                 'log to console  a very long m',
+                 'log to console  a very long message h',
+                 'log to console  a very long text h',
+                 'g', 'F', '  ', 'x', 'l\nl']
+        for line in lines:
+            self.history.append_string(line)
+            for text in texts:
+                self.assertEqual(self.get_suggestion(indexed, text),
+                                 self.get_suggestion(linear, text),
+                                 text)
+
+    def test_rank_by_frequency(self):
+        auto_suggest = IndexedAutoSuggestFromHistory(rank_by_frequency=True)
+        for line in ['log  a', 'log  b', 'log  a', 'log  c']:
+            self.history.append_string(line)
+        self.assertEqual(self.get_suggestion(auto_suggest, 'log'), '  a')
+        self.assertEqual(self.get_suggestion(auto_suggest, 'log  c'), '')
+
+        self.history.append_string('log  c')
+        self.history.append_string('log  c')
+        self.assertEqual(self.get_suggestion(auto_suggest, 'log'), '  c')
+
+    def test_history_not_copied(self):
+        auto_suggest = IndexedAutoSuggestFromHistory()
+        self.history.append_string('log  a')
+        with mock.patch.object(self.history, 'get_strings',
+                               side_effect=AssertionError):
+            self.assertEqual(self.get_suggestion(auto_suggest, 'l'), 'og  a')
+
+
+class BreakpointsTestCase(unittest.TestCase):
+    def test_find(self):
+        breakpoints = Breakpoints()
+        line = breakpoints.add('tests/step.robot:7')
+        current = breakpoints.add('8', current_path='/tmp/step.robot')
+        keyword = breakpoints.add('Log To Console', condition='$x')
+        keyword2 = breakpoints.add('BuiltIn.Keyword2')
+
+        def find(names, lineno, source):
+            return breakpoints.find(names, lineno, lambda: source)
+
+        self.assertEqual(find([], 7, '/root/tests/step.robot'), [line])
+        self.assertEqual(find([], 7, '/root/tests/other.robot'), [])
+        self.assertEqual(find([], 7, '/root/mytests/step.robot'), [])
+        self.assertEqual(find([], 8, '/tmp/step.robot'), [current])
+        self.assertEqual(find(['log_to_console'], 1, None), [keyword])
+        self.assertEqual(find(['BuiltIn.Keyword2', 'Keyword2'], 1, None),
+                         [keyword2])
+        self.assertEqual(keyword.condition, '$x')
+
+        self.assertIs(breakpoints.remove(line.number), line)
+        self.assertIsNone(breakpoints.remove(line.number))
+        self.assertEqual(find([], 7, '/root/tests/step.robot'), [])
+        self.assertEqual(len(breakpoints), 3)
+        breakpoints.clear()
+        self.assertFalse(breakpoints)
+
+
+class StepTraceTestCase(unittest.TestCase):
+    @mock.patch('time.perf_counter')
+    def test_elapsed(self, perf_counter):
+        trace = StepTrace()
+        trace.start_test('test')
+        trace.end_keyword()  # started before stepping, ignored
+
+        perf_counter.return_value = 1.0
+        trace.start_keyword('My Keyword', 3, 'a.robot')
+        perf_counter.return_value = 2.0
+        trace.start_keyword('BuiltIn.Sleep  1', 4, 'a.robot')
+        trace.add_pause(10.0)  # in debug shell
+        perf_counter.return_value = 13.0
+        trace.end_keyword()
+        perf_counter.return_value = 14.0
+        trace.end_keyword()
+
+        self.assertEqual([(r['keyword'], r['depth'], r['elapsed'])
+                          for r in trace.records],
+                         [('BuiltIn.Sleep  1', 1, 1.0),
+                          ('My Keyword', 0, 3.0)])
+        self.assertEqual(trace.test_elapsed, 3.0)
+        self.assertEqual([r['keyword'] for r in trace.pop_unreported()],
+                         ['My Keyword'])
+        self.assertEqual(trace.pop_unreported(), [])
+
+    @mock.patch('time.perf_counter')
+    def test_step_out(self, perf_counter):
+        trace = StepTrace()
+        trace.start_test('test')
+        perf_counter.return_value = 1.0
+        trace.start_keyword('My Keyword', 3, 'a.robot', 0)
+        trace.start_keyword('BuiltIn.Sleep  1', 4, 'a.robot', 1)
+        perf_counter.return_value = 3.0
+        # returned from My Keyword, the end of Sleep is not received
+        trace.end_keyword(0)
+        trace.start_keyword('BuiltIn.Sleep  2', 5, 'a.robot', 0)
+        perf_counter.return_value = 5.0
+        trace.end_keyword(0)
+
+        self.assertEqual([(r['keyword'], r['depth'], r['test_elapsed'])
+                          for r in trace.records],
+                         [('My Keyword', 0, 2.0),
+                          ('BuiltIn.Sleep  2', 0, 4.0)])
+
+
+class StepListenerTestCase(unittest.TestCase):
+    """Keywords of the test are run as:
+
+        A        line 1
+          B      line 2
+            C    line 3
+          D      line 4
+        E        line 5
+    """
+
+    def setUp(self):
+        self.listener = StepListener(mock.Mock())
+        self.listener.library._start_keyword.side_effect = self.stop
+        for name, value in (('in_step_mode', True), ('step_over_depth', None),
+                            ('step_until_lineno', None),
+                            ('current_source_lineno', 0),
+                            ('post_mortem', 0),
+                            ('breakpoints', Breakpoints()),
+                            ('step_listener', self.listener)):
+            patcher = mock.patch.object(context, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ('attach', 'detach'):
+            patcher = mock.patch.object(self.listener, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.stopped = []
+        self.commands = []
+
+    def stop(self, data, result, breakpoint, depth):
+        self.stopped.append((data.name, depth))
+        context.current_source_lineno = data.lineno
+        command = self.commands.pop(0) if self.commands else set_step_mode
+        command()
+
+    def run_keyword(self, name, lineno, *children, failing=()):
+        keyword = mock.Mock(type='KEYWORD', lineno=lineno, source='a.robot',
+                            full_name=name, status='PASS')
+        keyword.name = name
+        self.listener.start_body_item(keyword, keyword)
+        for child in children:
+            if self.run_keyword(*child, failing=failing) == 'FAIL':
+                keyword.status = 'FAIL'
+        if name in failing:
+            keyword.status = 'FAIL'
+        if name == 'BuiltIn.Run Keyword And Ignore Error':
+            keyword.status = 'PASS'
+        self.listener.end_body_item(keyword, keyword)
+        return keyword.status
+
+    def run_try(self, lineno, body, excepts=0, caught=False, failing=()):
+        """Run TRY with body, with EXCEPT branches or a FINALLY branch."""
+        root = mock.Mock(type='TRY/EXCEPT ROOT', lineno=lineno,
+                         source='a.robot', status='PASS',
+                         except_branches=[mock.Mock()] * excepts)
+        branch = mock.Mock(type='TRY', lineno=lineno, source='a.robot',
+                           parent=root, status='PASS')
+        branch.data = branch
+        self.listener.start_body_item(root, root)
+        self.listener.start_body_item(branch, branch)
+        if self.run_keyword(*body, failing=failing) == 'FAIL':
+            branch.status = 'FAIL'
+        self.listener.end_body_item(branch, branch)
+        if not excepts:
+            final = mock.Mock(type='FINALLY', lineno=lineno + 10,
+                              source='a.robot', status='PASS')
+            self.listener.start_body_item(final, final)
+            self.run_keyword('Log', lineno + 11)
+            self.listener.end_body_item(final, final)
+        if branch.status == 'FAIL' and not caught:
+            root.status = 'FAIL'
+        self.listener.end_body_item(root, root)
+        return root.status
+
+    def run_test(self):
+        self.run_keyword('A', 1, ('B', 2, ('C', 3)), ('D', 4))
+        self.run_keyword('E', 5)
+
+    def test_step(self):
+        self.run_test()
+        self.assertEqual(self.stopped,
+                         [('A', 0), ('B', 1), ('C', 2), ('D', 1), ('E', 0)])
+
+    def test_step_over(self):
+        self.commands = [set_step_mode, step_over]
+        self.run_test()
+        self.assertEqual(self.stopped, [('A', 0), ('B', 1), ('D', 1),
+                                        ('E', 0)])
+
+    def test_step_over_returns(self):
+        # attached while Debug keyword in B is running
+        self.listener.depth = 2
+        step_over()
+        self.listener.end_body_item(None, None)  # Debug
+        self.run_keyword('Log', 3)
+        self.listener.end_body_item(None, None)  # B
+        self.run_keyword('D', 4)
+        self.assertEqual(self.stopped, [('Log', 1), ('D', 0)])
+
+    def test_step_out(self):
+        self.commands = [set_step_mode, step_out]
+        self.run_test()
+        self.assertEqual(self.stopped, [('A', 0), ('B', 1), ('E', 0)])
+
+    def test_until(self):
+        self.commands = [set_step_mode, lambda: step_over(until_lineno=4)]
+        self.run_test()
+        self.assertEqual(self.stopped, [('A', 0), ('B', 1), ('D', 1),
+                                        ('E', 0)])
+
+        self.stopped = []
+        self.commands = [lambda: step_over(until_lineno=6)]
+        self.run_test()
+        self.assertEqual(self.stopped, [('A', 0)])
+
+    def test_post_mortem(self):
+        context.in_step_mode = False
+        context.post_mortem = 2
+        failed = []
+
+        def post_mortem(data, result, message):
+            context.post_mortem -= 1
+            failed.append(data.name)
+
+        self.listener.library._post_mortem.side_effect = post_mortem
+        failing = ('C', 'D', 'E', 'F')
+        self.run_keyword('A', 1, ('B', 2, ('C', 3)), failing=failing)
+        self.run_keyword('BuiltIn.Run Keyword And Ignore Error', 4,
+                         ('D', 5), failing=failing)
+        self.run_keyword('E', 6, failing=failing)
+        self.run_keyword('F', 7, failing=failing)
+        self.assertEqual(failed, ['C', 'E'])
+        self.assertEqual(self.stopped, [])
+
+    def test_post_mortem_try(self):
+        context.in_step_mode = False
+        context.post_mortem = 5
+        failed = []
+
+        def post_mortem(data, result, message):
+            failed.append(data.name)
+
+        self.listener.library._post_mortem.side_effect = post_mortem
+        failing = ('C', 'D', 'E')
+        self.run_try(1, ('A', 2, ('B', 3), ('C', 4)), excepts=1, caught=True,
+                     failing=failing)
+        self.assertEqual(failed, [])
+        # TRY/FINALLY catches nothing
+        self.run_try(5, ('D', 6), failing=failing)
+        self.assertEqual(failed, ['D'])
+        # failure not matched by EXCEPT is reported at the failing keyword
+        self.run_try(20, ('E', 21), excepts=2, failing=failing)
+        self.assertEqual(failed, ['D', 'E'])
+        self.assertEqual(self.stopped, [])
+
+
+class DebugShellTestCase(unittest.TestCase):
+    def setUp(self):
+        # restored after DebugKeywords replaced them
+        for name, value in (('debug_cmd', None), ('step_listener', None),
+                            ('step_trace', None), ('breakpoints', None),
+                            ('post_mortem', 0)):
+            patcher = mock.patch.object(context, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('DebugLibrary.keywords.is_interactive',
+                             return_value=True)
+        self.is_interactive = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch.object(DebugCmd, 'cmdloop')
+    def test_reuse_debug_cmd(self, cmdloop):
+        keywords = DebugKeywords()
+        keywords.debug()
+        debug_cmd = context.debug_cmd
+        keywords.debug()
+        DebugKeywords().debug()
+
+        self.assertIsInstance(debug_cmd, DebugCmd)
+        self.assertIs(context.debug_cmd, debug_cmd)
+        self.assertEqual(cmdloop.call_count, 3)
+
+    def test_reuse_prompt_session(self):
+        debug_cmd = DebugCmd()
+        session = debug_cmd.get_prompt_session()
+        self.assertIs(debug_cmd.get_prompt_session(), session)
+
+    def run_in_shell(self, keywords, status):
+        """Run Debug keyword, and a keyword in its shell."""
+        keyword = mock.Mock(type='KEYWORD', lineno=1, source='a.robot',
+                            full_name='BuiltIn.Log', status=status)
+        keyword.name = 'Log'
+
+        def cmdloop(*args, **kwargs):
+            context.step_listener.start_body_item(keyword, keyword)
+            context.step_listener.end_body_item(keyword, keyword)
+
+        with mock.patch.object(DebugCmd, 'cmdloop', side_effect=cmdloop), \
+                mock.patch.object(StepListener, 'attach'):
+            keywords.debug()
+        self.assertFalse(context.step_listener.suspended)
+
+    def test_breakpoint_in_shell(self):
+        keywords = DebugKeywords()
+        context.breakpoints.add('Log')
+        with mock.patch.object(keywords, '_start_keyword') as start:
+            self.run_in_shell(keywords, 'PASS')
+        start.assert_not_called()
+
+    def test_post_mortem_in_shell(self):
+        keywords = DebugKeywords()
+        context.post_mortem = 3
+        with mock.patch.object(keywords, '_post_mortem') as post_mortem:
+            self.run_in_shell(keywords, 'FAIL')
+        post_mortem.assert_not_called()
+        self.assertEqual(context.post_mortem, 3)
+
+    def test_post_mortem_outside_robot(self):
+        # like imported by libdoc
+        DebugLibrary(post_mortem='1')
+        self.addCleanup(context.step_listener.detach)
+        self.assertEqual(context.post_mortem, 1)
+        with self.assertRaisesRegex(ValueError, 'post_mortem'):
+            DebugLibrary(post_mortem='true')
+
+    @mock.patch.object(DebugCmd, 'default')
+    def test_clear_keyword(self, default):
+        with mock.patch.object(context, 'breakpoints', Breakpoints()):
+            context.breakpoints.add('Log')
+            DebugCmd().onecmd('clear element text  id:x')
+            self.assertEqual(len(context.breakpoints), 1)
+        default.assert_called_once_with('clear element text  id:x')
+
+    @mock.patch.object(DebugCmd, 'default')
+    def test_return_keyword(self, default):
+        DebugCmd().onecmd('return from keyword  42')
+        default.assert_called_once_with('return from keyword  42')
+
+    @mock.patch.object(DebugCmd, 'cmdloop')
+    def test_skip_non_interactive(self, cmdloop):
+        self.is_interactive.return_value = False
+        DebugKeywords().debug()
+        self.assertEqual(cmdloop.call_count, 0)
+
+        with mock.patch.object(context, 'non_interactive', 'shell'):
+            DebugKeywords().debug()
+        self.assertEqual(cmdloop.call_count, 1)
+
+    @mock.patch.object(DebugCmd, 'cmdloop')
+    def test_pending_script_non_interactive(self, cmdloop):
+        self.is_interactive.return_value = False
+        context.debug_cmd = DebugCmd()
+        context.debug_cmd.set_script(['s', 'log  done'])
+        DebugKeywords().debug()
+        self.assertEqual(cmdloop.call_count, 1)
+
+    @mock.patch('DebugLibrary.keywords.logger')
+    @mock.patch('DebugLibrary.keywords.write_snapshot',
+                side_effect=OSError('read-only'))
+    def test_snapshot_failed(self, write_snapshot, logger):
+        self.is_interactive.return_value = False
+        with mock.patch.object(context, 'non_interactive', 'snapshot'):
+            DebugKeywords().debug()
+        self.assertIn('failed to save snapshot: read-only',
+                      logger.warn.call_args[0][0])
+
+    def test_snapshot_non_interactive(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            suite = os.path.join(tempdir, 'snapshot.robot')
+            with open(suite, 'w') as f:
+                f.write('*** Settings ***\n'
+                        'Library  DebugLibrary  non_interactive=snapshot\n'
+                        '\n'
+                        '*** Test Cases ***\n'
+                        'test\n'
+                        '    ${value} =  Set Variable  42\n'
+                        '    Debug\n')
+            result = subprocess.run(
+                [sys.executable, '-m', 'robot', '--outputdir', tempdir,
+                 '--output', 'NONE', '--log', 'NONE', '--report', 'NONE',
+                 suite],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE, timeout=TIMEOUT_SECONDS * 3)
+            self.assertEqual(result.returncode, 0)
+            self.assertIn(b'saved snapshot to', result.stderr)
+
+            with open(os.path.join(tempdir, 'rfdebug-snapshot-1.json')) as f:
+                snapshot = json.load(f)
+        self.assertEqual(snapshot['test'], 'test')
+        self.assertEqual(snapshot['variables']['${value}'], "'42'")
+        if get_version() >= '6.0':
+            self.assertEqual(snapshot['source'], suite)
+            self.assertEqual(snapshot['lineno'], 7)
+
+
 class FunctionalTestCase(unittest.TestCase):
     def test_base_functional(self):
         assert base_functional_testing() == 'OK'
@@ -169,14 +948,47 @@ class FunctionalTestCase(unittest.TestCase):
     def test_step_functional(self):
         assert step_functional_testing() == 'OK'
 
+    def test_breakpoint_functional(self):
+        assert breakpoint_functional_testing() == 'OK'
+
+    def test_script_functional(self):
+        assert script_functional_testing() == 'OK'
+
+    def test_post_mortem_functional(self):
+        assert post_mortem_functional_testing() == 'OK'
+
 
 def suite():
     suite = unittest.TestSuite()
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        CmdCompleterTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        SourceCacheTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        KeywordsCacheTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        HistoryTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        AutoSuggestTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        BreakpointsTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        StepTraceTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        StepListenerTestCase))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(
+        DebugShellTestCase))
     suite.addTest(FunctionalTestCase('test_base_functional'))
     suite.addTest(FunctionalTestCase('test_step_functional'))
+    suite.addTest(FunctionalTestCase('test_breakpoint_functional'))
+    suite.addTest(FunctionalTestCase('test_script_functional'))
+    suite.addTest(FunctionalTestCase('test_post_mortem_functional'))
     return suite
 
 
 if __name__ == '__main__':
     print(base_functional_testing())
     print(step_functional_testing())
+    print(breakpoint_functional_testing())
+    print(script_functional_testing())
+    print(post_mortem_functional_testing())